@@ -11,12 +11,22 @@
 """
 
 import os
+import re
 import json
+import pickle
+import zipfile
+import hashlib
+import tempfile
+import struct
+import zlib
 from pathlib import Path
 import logging
 import argparse
 import time
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import nltk
 nltk.data.path = [
     r"C:\Users\Rashed_Dadou\nltk_data",
@@ -24,6 +34,7 @@ nltk.data.path = [
 ] + nltk.data.path
 
 from speech_visualizer import visualize_from_json
+from speech_frame_ring import SharedFrameRing, RECORD_FLOATS
 
 try:
     import epitran
@@ -223,55 +234,168 @@ ANIMAL_SOUND_MECHANISMS = {
     }
 }
 
+# ─── القاموس اليدوي للكلمات الشائعة (ARPAbet) ────────────────
+SIMPLE_FALLBACK = {
+    'hello':    'HH AH0 L OW1',
+    'world':    'W ER1 L D',
+    'this':     'DH IH0 S',
+    'is':       'IH0 Z',
+    'a':        'AH0',
+    'test':     'T EH1 S T',
+    'the':      'DH AH0',
+    'quick':    'K W IH1 K',
+    'brown':    'B R AW1 N',
+    'fox':      'F AA1 K S',
+    'jumps':    'JH AH1 M P S',
+    'over':     'OW1 V ER0',
+    'lazy':     'L EY1 Z IY0',
+    'dog':      'D AO1 G',
+    'good':     'G UH1 D',
+    'morning':  'M AO1 R N IH0 NG',
+    'everyone': 'EH1 V R IY0 W AH2 N',
+    # أضف أي كلمات أخرى تريدها هنا
+}
+
+
+def clean_word(word: str) -> str:
+    # إزالة أي علامات ترقيم بسيطة
+    return word.strip(",.!?").lower()
+
+
+# ─── كلمات خارج القاموس (OOV): g2p_en دفعة واحدة أو قواعد letter-to-sound ────────────────
+# كاش للكلمات المتوقعة (يمتلئ تدريجيًا، كل كلمة تُحسب مرة واحدة فقط)
+WORD_PHONEME_CACHE = {}
+
+# قواعد letter-to-sound بسيطة (الأطول أولًا) - تُستخدم لو g2p_en غير متاحة
+LETTER_TO_SOUND_RULES = [
+    ('tion', 'SH AH0 N'), ('ough', 'AO1'), ('igh', 'AY1'),
+    ('th', 'TH'), ('sh', 'SH'), ('ch', 'CH'), ('ph', 'F'), ('ng', 'NG'), ('ck', 'K'),
+    ('wh', 'W'), ('qu', 'K W'), ('ee', 'IY1'), ('ea', 'IY1'), ('oo', 'UW1'), ('ou', 'AW1'),
+    ('ow', 'OW1'), ('ai', 'EY1'), ('ay', 'EY1'), ('oi', 'OY1'), ('oy', 'OY1'), ('au', 'AO1'), ('aw', 'AO1'),
+    ('a', 'AE1'), ('e', 'EH1'), ('i', 'IH1'), ('o', 'AA1'), ('u', 'AH1'), ('y', 'IY0'),
+    ('b', 'B'), ('c', 'K'), ('d', 'D'), ('f', 'F'), ('g', 'G'), ('h', 'HH'), ('j', 'JH'), ('k', 'K'),
+    ('l', 'L'), ('m', 'M'), ('n', 'N'), ('p', 'P'), ('q', 'K'), ('r', 'R'), ('s', 'S'), ('t', 'T'),
+    ('v', 'V'), ('w', 'W'), ('x', 'K S'), ('z', 'Z'),
+]
+
+
+def letter_to_sound(word: str) -> str:
+    """تقريب ARPAbet بالقواعد - النبر الأساسي ('1') على أول حرف علة فقط"""
+    letters = ''.join(ch for ch in word if 'a' <= ch <= 'z')
+    if len(letters) > 2 and letters.endswith('e') and letters[-2] not in 'aeiou':
+        letters = letters[:-1]  # e صامتة في الآخر
+
+    phones = []
+    i = 0
+    while i < len(letters):
+        for grapheme, arpabet in LETTER_TO_SOUND_RULES:
+            if letters.startswith(grapheme, i):
+                phones.extend(arpabet.split())
+                i += len(grapheme)
+                break
+        else:
+            i += 1
+
+    stressed = False
+    for idx, phone in enumerate(phones):
+        if phone.endswith('1'):
+            if stressed:
+                phones[idx] = phone[:-1] + '0'
+            stressed = True
+    return " ".join(phones)
+
+
+def _g2p_batch(words: list[str]) -> list[str]:
+    """
+    تشغيل g2p_en على كل الكلمات باستدعاء واحد (الكلمات مفصولة بـ ' ' في الإخراج)
+    لو عدد المجموعات ما طابق (g2p يحذف رموز غير حرفية) → كلمة بكلمة عبر cmudict/predict
+    """
+    groups = [[]]
+    for phone in g2p(" ".join(words)):
+        if phone == " ":
+            groups.append([])
+        elif phone.strip():
+            groups[-1].append(phone)
+    if len(groups) == len(words) and all(groups):
+        return [" ".join(group) for group in groups]
+
+    predictions = []
+    for word in words:
+        if word in g2p.cmu:
+            predictions.append(" ".join(g2p.cmu[word][0]))
+        else:
+            predictions.append(" ".join(g2p.predict(word)))
+    return predictions
+
+
+def resolve_oov_words(words, language: str = 'eng') -> int:
+    """
+    جمع الكلمات غير الموجودة في القاموس/الكاش، إزالة التكرار، وتوقعها دفعة واحدة
+    - يرجع عدد الكلمات الجديدة اللي انضافت للكاش
+    - غير الإنجليزي → يبقى على 'SIL' (g2p_en إنجليزي فقط)
+    """
+    if not language.startswith('eng'):
+        return 0
+
+    unknown = list(dict.fromkeys(
+        word for word in words
+        if any('a' <= ch <= 'z' for ch in word)
+        and word not in SIMPLE_FALLBACK and word not in WORD_PHONEME_CACHE
+    ))
+    if not unknown:
+        return 0
+
+    if g2p is not None:
+        try:
+            predictions = _g2p_batch(unknown)
+        except Exception as e:
+            logger.warning(f"فشل g2p_en → استخدام قواعد letter-to-sound: {e}")
+            predictions = [letter_to_sound(word) for word in unknown]
+    else:
+        predictions = [letter_to_sound(word) for word in unknown]
+
+    for word, phonemes in zip(unknown, predictions):
+        if phonemes:
+            WORD_PHONEME_CACHE[word] = phonemes
+    return len(unknown)
+
+
+def word_to_phonemes(word: str) -> str:
+    """فونيمات كلمة واحدة (بعد clean_word) - من القاموس، ثم كاش OOV، أو 'SIL' كبديل مؤقت"""
+    if word in SIMPLE_FALLBACK:
+        return SIMPLE_FALLBACK[word]
+    if word in WORD_PHONEME_CACHE:
+        return WORD_PHONEME_CACHE[word]
+    # fallback بسيط جدًا
+    return "SIL " * (len(word) // 2 + 2)
+
 # ─── دالة لتحويل نص بشري إلى فونيمات حسب اللغة ────────────────
 def text_to_phonemes(text: str, language: str = 'eng') -> str:
     """
     تحويل نص إنجليزي بسيط إلى تمثيل فونيمي تقريبي
     - تستخدم قاموسًا يدويًا صغيرًا للكلمات الشائعة
-    - الباقي يرجع سلسلة من 'SIL' كبديل مؤقت
+    - الكلمات الباقية تُتوقع دفعة واحدة (resolve_oov_words) وتُحفظ في الكاش
+    - غير الإنجليزي يرجع سلسلة من 'SIL' كبديل مؤقت
     """
     text = text.strip()
     if not text:
         return "sil"
 
-    # القاموس اليدوي (هنا المكان اللي كنت أقصده)
-    simple_fallback = {
-        'hello':    'HH AH0 L OW1',
-        'world':    'W ER1 L D',
-        'this':     'DH IH0 S',
-        'is':       'IH0 Z',
-        'a':        'AH0',
-        'test':     'T EH1 S T',
-        'the':      'DH AH0',
-        'quick':    'K W IH1 K',
-        'brown':    'B R AW1 N',
-        'fox':      'F AA1 K S',
-        'jumps':    'JH AH1 M P S',
-        'over':     'OW1 V ER0',
-        'lazy':     'L EY1 Z IY0',
-        'dog':      'D AO1 G',
-        'good':     'G UH1 D',
-        'morning':  'M AO1 R N IH0 NG',
-        'everyone': 'EH1 V R IY0 W AH2 N',
-        # أضف أي كلمات أخرى تريدها هنا
-    }
-
     # تقسيم النص إلى كلمات
-    words = text.lower().split()
+    words = [clean_word(word) for word in text.lower().split()]
+    resolve_oov_words(words, language)
 
-    result = []
-    for word in words:
-        # إزالة أي علامات ترقيم بسيطة (اختياري)
-        clean_word = word.strip(",.!?").lower()
-        if clean_word in simple_fallback:
-            result.append(simple_fallback[clean_word])
-        else:
-            # fallback بسيط جدًا
-            result.append("SIL " * (len(clean_word) // 2 + 2))
+    result = [word_to_phonemes(word) for word in words]
 
     # جمع النتيجة
     return " ".join(result).strip()
 
+
+def text_to_phonemes_batch(texts: list[str], language: str = 'eng') -> list[str]:
+    """نفس text_to_phonemes لعدة نصوص - الكلمات OOV من كل النصوص تُتوقع في دفعة واحدة"""
+    resolve_oov_words((clean_word(w) for text in texts for w in text.lower().split()), language)
+    return [text_to_phonemes(text, language) for text in texts]
+
 # ─── قاموس ربط: IPA symbol → فئة viseme (أو صوت مشابه) ────────────────
 PHONEME_TO_VISEME = {
     # مشترك
@@ -329,6 +453,15 @@ VISEME_DETAILS = {
 }
 
 
+# ─── مضاعفات العاطفة على القيم العددية للفيزيم ────────────────
+EMOTION_MULTIPLIERS = {
+    'neutral':  {'mouth_open': 1.0, 'jaw_open': 1.0, 'lip_round': 1.0, 'lip_spread': 1.0},
+    'happy':    {'mouth_open': 0.9,  'jaw_open': 0.8,  'lip_round': 0.7,  'lip_spread': 1.4},
+    'angry':    {'mouth_open': 1.3,  'jaw_open': 1.4,  'lip_round': 0.9,  'lip_spread': 0.6},
+    'surprised':{'mouth_open': 1.6,  'jaw_open': 1.5,  'lip_round': 0.2,  'lip_spread': 0.3},
+    'sad':      {'mouth_open': 0.7,  'jaw_open': 0.6,  'lip_round': 1.1,  'lip_spread': -0.4},
+}
+
 # ─── دالة لربط الفونيمات بالفيزيمات ────────────────
 def phonemes_to_visemes(phonemes: str, emotion: str = 'neutral') -> list[dict]:
     """
@@ -337,13 +470,6 @@ def phonemes_to_visemes(phonemes: str, emotion: str = 'neutral') -> list[dict]:
     - viseme_category
     - params (عددية + وصفية)
     """
-    EMOTION_MULTIPLIERS = {
-        'neutral':  {'mouth_open': 1.0, 'jaw_open': 1.0, 'lip_round': 1.0, 'lip_spread': 1.0},
-        'happy':    {'mouth_open': 0.9,  'jaw_open': 0.8,  'lip_round': 0.7,  'lip_spread': 1.4},
-        'angry':    {'mouth_open': 1.3,  'jaw_open': 1.4,  'lip_round': 0.9,  'lip_spread': 0.6},
-        'surprised':{'mouth_open': 1.6,  'jaw_open': 1.5,  'lip_round': 0.2,  'lip_spread': 0.3},
-        'sad':      {'mouth_open': 0.7,  'jaw_open': 0.6,  'lip_round': 1.1,  'lip_spread': -0.4},
-    }
     mult = EMOTION_MULTIPLIERS.get(emotion.lower(), EMOTION_MULTIPLIERS['neutral'])
 
     result = []
@@ -381,6 +507,107 @@ def get_viseme_numeric_params(viseme_category: str, emotion='neutral'):
     mult = EMOTION_MULTIPLIERS.get(emotion.lower(), EMOTION_MULTIPLIERS['neutral'])
     return {k: base.get(k, 0.0) * mult.get(k, 1.0) for k in ['mouth_open', 'jaw_open', 'lip_round', 'lip_spread']}
 
+# ─── فهرس عكسي: قيم الفم العددية → أقرب فئة viseme (+ عاطفة) ────────────────
+VISEME_NUMERIC_KEYS = ('mouth_open', 'jaw_open', 'lip_round', 'lip_spread')
+
+
+class VisemeIndex:
+    """
+    أقرب جار (nearest neighbour) على مصفوفة float32 مبنية من VISEME_DETAILS × EMOTION_MULTIPLIERS
+    - الجدول صغير (عشرات الصفوف) → brute-force متجه أسرع من KD-tree
+    - المسافة = |q|² - 2 q·c + |c|² (ضرب مصفوفات واحد لكل chunk)
+    """
+
+    def __init__(self, chunk_size: int = 65536):
+        self.categories = list(VISEME_DETAILS)
+        self.emotions = list(EMOTION_MULTIPLIERS)
+        self.chunk_size = chunk_size
+
+        rows, cat_idx, emo_idx = [], [], []
+        for ci, category in enumerate(self.categories):
+            for ei, emotion in enumerate(self.emotions):
+                params = get_viseme_numeric_params(category, emotion)
+                rows.append([params[k] for k in VISEME_NUMERIC_KEYS])
+                cat_idx.append(ci)
+                emo_idx.append(ei)
+
+        self.points = np.asarray(rows, dtype=np.float32)
+        self.points_t = np.ascontiguousarray(self.points.T)
+        self.points_sq = (self.points ** 2).sum(axis=1)
+        self.row_category = np.asarray(cat_idx, dtype=np.int32)
+        self.row_emotion = np.asarray(emo_idx, dtype=np.int32)
+
+    def query(self, vectors, k: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        vectors: مصفوفة (N, 4) بترتيب VISEME_NUMERIC_KEYS
+        يرجع (category_idx, emotion_idx, distance) بشكل (N, k) — الفهارس على self.categories / self.emotions
+        """
+        q = np.asarray(vectors, dtype=np.float32).reshape(-1, len(VISEME_NUMERIC_KEYS))
+        k = min(k, len(self.points))
+        rows = np.empty((len(q), k), dtype=np.int64)
+        dists = np.empty((len(q), k), dtype=np.float32)
+
+        for start in range(0, len(q), self.chunk_size):
+            chunk = q[start:start + self.chunk_size]
+            d = chunk @ self.points_t
+            d *= -2.0
+            d += self.points_sq
+            d += (chunk ** 2).sum(axis=1, keepdims=True)
+
+            if k == 1:
+                best = np.argmin(d, axis=1)[:, None]
+            else:
+                best = np.argpartition(d, k - 1, axis=1)[:, :k]
+                order = np.argsort(np.take_along_axis(d, best, axis=1), axis=1)
+                best = np.take_along_axis(best, order, axis=1)
+            rows[start:start + len(chunk)] = best
+            dists[start:start + len(chunk)] = np.sqrt(np.maximum(np.take_along_axis(d, best, axis=1), 0.0))
+
+        return self.row_category[rows], self.row_emotion[rows], dists
+
+    def match_movements(self, movements: list[dict]) -> list[dict]:
+        """مطابقة حركات (مثل animation_sequence أو بيانات capture خارجية) → أقرب فئة لكل فريم"""
+        vectors = np.array([[frame.get(key, 0.0) for key in VISEME_NUMERIC_KEYS] for frame in movements],
+                           dtype=np.float32)
+        cat_idx, emo_idx, dists = self.query(vectors)
+        return [
+            {
+                "viseme_category": self.categories[c],
+                "emotion": self.emotions[e],
+                "distance": float(d),
+            }
+            for c, e, d in zip(cat_idx[:, 0], emo_idx[:, 0], dists[:, 0])
+        ]
+
+    def check_track(self, movements: list[dict]) -> dict:
+        """
+        فحص جودة مسار مولد: نسبة الفريمات اللي أقرب فئة لها = viseme_category المكتوبة
+        (الفئات اللي ما لها قيم في VISEME_DETAILS تتحول إلى 'sil' كما في phonemes_to_visemes)
+        """
+        matches = self.match_movements(movements)
+        mismatched = [
+            frame.get('time_step', idx)
+            for idx, (frame, match) in enumerate(zip(movements, matches))
+            if (frame.get('viseme_category') if frame.get('viseme_category') in VISEME_DETAILS else 'sil')
+            != match['viseme_category']
+        ]
+        return {
+            "frames": len(movements),
+            "match_ratio": 1.0 - len(mismatched) / max(1, len(movements)),
+            "mismatched_time_steps": mismatched,
+        }
+
+
+_VISEME_INDEX = None
+
+
+def get_viseme_index() -> VisemeIndex:
+    """الفهرس يُبنى مرة واحدة عند أول استخدام"""
+    global _VISEME_INDEX
+    if _VISEME_INDEX is None:
+        _VISEME_INDEX = VisemeIndex()
+    return _VISEME_INDEX
+
 # ─── دالة لمحاكاة الحركات البشرية ────────────────
 def simulate_human_speech_movements(viseme_list: list[dict]) -> list[dict]:
     movements = []
@@ -401,6 +628,150 @@ def simulate_human_speech_movements(viseme_list: list[dict]) -> list[dict]:
         })
     return movements
 
+# ─── مسار الإيماءات/حركة الجسم (body/face) على نفس الـ timeline ────────────────
+# مدة الفريم الواحد بالثواني (نفس duration_per_step في speech_visualizer)
+FRAME_DURATION_SEC = 0.12
+
+# ربط فئة الفيزيم (VISEME_DETAILS / PHONEME_TO_VISEME) → مفتاح في VISeme_ANIMATION_HUMAN
+VISEME_TO_ANIMATION_KEY = {
+    'bilabial': 'PP',
+    'labiodental': 'FF',
+    'interdental': 'TH',
+    'alveolar_fricative': 'SS',
+    'postalveolar_fricative': 'SH',
+    'alveolar_stop': 'T', 'alveolar_lateral': 'T', 'flap': 'T', 'rhotic': 'T', 'velar_stop': 'T',
+    'alveolar_nasal': 'AINF',
+    'close_front': 'IY', 'near_close_near_front': 'IY', 'palatal_approximant': 'IY',
+    'close_back_rounded': 'UW', 'labiovelar_approximant': 'UW',
+    'open_back': 'AA', 'open_central': 'AA',
+    'pharyngeal_fricative': 'HLQ', 'uvular_stop': 'HLQ', 'uvular_fricative': 'HLQ',
+    'emphatic_fricative': 'HLQ', 'emphatic_stop': 'HLQ', 'glottal_stop': 'HLQ',
+    'sil': 'SIL',
+}
+
+# ربط رمز ARPAbet (بدون رقم النبر) → مفتاح في VISeme_ANIMATION_HUMAN
+# فونيمات الإنجليزي ARPAbet → phonemes_to_visemes يعطيها كلها 'sil' → المفتاح يُؤخذ من الرمز نفسه
+ARPABET_TO_ANIMATION_KEY = {
+    'P': 'PP', 'B': 'PP', 'M': 'PP',
+    'F': 'FF', 'V': 'FF',
+    'TH': 'TH', 'DH': 'TH',
+    'S': 'SS', 'Z': 'SS',
+    'SH': 'SH', 'ZH': 'SH', 'CH': 'SH', 'JH': 'SH',
+    'T': 'T', 'D': 'T', 'L': 'T', 'R': 'T', 'K': 'T', 'G': 'T',
+    'N': 'AINF', 'NG': 'AINF',
+    'HH': 'HLQ',
+    'IY': 'IY', 'IH': 'IY', 'EY': 'IY', 'Y': 'IY',
+    'UW': 'UW', 'UH': 'UW', 'OW': 'UW', 'OY': 'UW', 'W': 'UW',
+    'AA': 'AA', 'AE': 'AA', 'AH': 'AA', 'AO': 'AA', 'AW': 'AA', 'AY': 'AA', 'EH': 'AA', 'ER': 'AA',
+    'SIL': 'SIL',
+}
+
+
+def annotate_animation_keys(segment: str, viseme_items: list[dict]) -> list[dict]:
+    """
+    يضيف params['animation_key'] لكل item من phonemes_to_visemes(segment)
+    - كل item يغطي حرف/حرفين من segment → المفتاح من رمز ARPAbet اللي فيه الحرف
+    - المسافة بين رمزين تكمل مفتاح الرمز السابق (الإيماءة ما تنقطع داخل الكلمة)
+    - المسافة في الأطراف والرموز غير ARPAbet (IPA) → من viseme_category
+    """
+    char_keys = [None] * len(segment)
+    previous = None
+    for match in re.finditer(r'\S+', segment):
+        key = ARPABET_TO_ANIMATION_KEY.get(match.group().rstrip('012'))
+        start = match.start() if previous is None else previous[0]
+        for pos in range(start, match.end()):
+            char_keys[pos] = key if pos >= match.start() else previous[1]
+        previous = (match.end(), key)
+
+    pos = 0
+    for item in viseme_items:
+        key = char_keys[pos] if pos < len(char_keys) else None
+        if key is None:
+            key = VISEME_TO_ANIMATION_KEY.get(item['params'].get('viseme_category', 'sil'), 'SIL')
+        item['params']['animation_key'] = key
+        pos += len(item['phoneme'])
+    return viseme_items
+
+# الإيماءة المستخدمة للنبر (stress) في الـ prosody
+STRESS_BEAT_GESTURE = 'slight head nod'
+
+# جدول ثابت: وصف الإيماءة → رقم صغير (مرتب → ثابت بين التشغيلات)
+GESTURE_TABLE = sorted(
+    {anim[channel] for anim in VISeme_ANIMATION_HUMAN.values() for channel in ('face', 'body')}
+    | {STRESS_BEAT_GESTURE}
+)
+GESTURE_IDS = {gesture: idx for idx, gesture in enumerate(GESTURE_TABLE)}
+
+
+def _frame_gesture(frame: dict, channel: str) -> str:
+    key = frame.get('animation_key') or VISEME_TO_ANIMATION_KEY.get(frame.get('viseme_category', 'sil'), 'SIL')
+    return VISeme_ANIMATION_HUMAN[key][channel]
+
+
+def frame_gesture_ids(movements: list[dict], channel: str) -> bytes:
+    """رقم الإيماءة لكل فريم في قناة (face/body) - بايت واحد لكل فريم (GESTURE_TABLE صغير)"""
+    return bytes(GESTURE_IDS[_frame_gesture(frame, channel)] for frame in movements)
+
+
+def _runs_to_events(gesture_ids: bytes, min_hold: int) -> list[list[int]]:
+    """
+    تحويل أرقام الإيماءات لكل فريم → أحداث [onset, duration, gesture_id]
+    - الفريمات المتتالية المتشابهة تندمج في حدث واحد
+    - أي مقطع أقصر من min_hold يُضم للحدث السابق (الجسم أبطأ من الفم)
+    متجه بـ numpy: مقطع يبدأ حدث جديد فقط إذا كان الأول أو طوله ≥ min_hold
+    وإيماءته تختلف عن آخر مقطع بهالشرط قبله
+    """
+    ids = np.frombuffer(gesture_ids, dtype=np.uint8)
+    if len(ids) == 0:
+        return []
+
+    starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+    durations = np.diff(np.append(starts, len(ids)))
+    anchors = np.flatnonzero(durations >= min_hold)
+    if len(anchors) == 0 or anchors[0] != 0:
+        anchors = np.concatenate(([0], anchors))
+
+    anchor_ids = ids[starts[anchors]]
+    opens = np.ones(len(anchors), dtype=bool)
+    opens[1:] = anchor_ids[1:] != anchor_ids[:-1]
+    onsets = starts[anchors[opens]]
+    return np.stack([onsets, np.diff(np.append(onsets, len(ids))), ids[onsets]], axis=1).tolist()
+
+
+def has_primary_stress(phonemes: str) -> bool:
+    """النبر الأساسي في ARPAbet = رمز ينتهي بـ '1' (AH1, OW1, ...)"""
+    return any(token.endswith('1') for token in phonemes.split())
+
+
+def stress_beats(timed_plan: list[dict]) -> list[int]:
+    """أول فريم لكل كلمة منبورة من خطة فيها onset/stress (build_prosodic_movements)"""
+    return [item["onset"] for item in timed_plan if item.get("stress")]
+
+
+def generate_gesture_track(movements: list[dict], beats: list[int] = None, min_hold: int = 3) -> dict:
+    """
+    توليد مسار إيماءات موازٍ لمسار الفم من VISeme_ANIMATION_HUMAN
+    - القنوات: face, body, beat
+    - beats: أول فريم لكل كلمة منبورة (stress_beats) → نفس النبر اللي في result["prosody"]
+    - الأحداث بوحدة الفريم (نفس time_step) → [onset, duration, gesture_id]
+    - gesture_id يشير إلى gesture_table
+    """
+    return build_gesture_track(
+        frame_gesture_ids(movements, 'face'), frame_gesture_ids(movements, 'body'), beats, min_hold
+    )
+
+
+def build_gesture_track(face_ids: bytes, body_ids: bytes, beats: list[int] = None, min_hold: int = 3) -> dict:
+    """نفس generate_gesture_track من أرقام الإيماءات الجاهزة لكل فريم (frame_gesture_ids)"""
+    beat_id = GESTURE_IDS[STRESS_BEAT_GESTURE]
+    return {
+        "frame_duration": FRAME_DURATION_SEC,
+        "gesture_table": GESTURE_TABLE,
+        "face": _runs_to_events(face_ids, min_hold),
+        "body": _runs_to_events(body_ids, min_hold),
+        "beat": [[onset, min_hold, beat_id] for onset in beats or ()],
+    }
+
 # ─── دالة محاكاة آليات إنتاج الصوت للحيوانات ────────────────
 def simulate_animal_sound(animal_type: str, sound_description: str) -> dict:
     """
@@ -422,10 +793,245 @@ def simulate_animal_sound(animal_type: str, sound_description: str) -> dict:
         "ai_application": mechanism.get('ai_application', 'غير محدد')
     }
 
+# ─── محرك استخراج الميزات (mel spectrogram, pitch, formants) ────────────────
+def _mel_filterbank(sample_rate: int, n_fft: int, n_mels: int, fmin: float, fmax: float) -> np.ndarray:
+    """مصفوفة فلاتر mel مثلثية بشكل (n_mels, n_fft//2 + 1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    bin_freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bin_freqs - lower) / np.maximum(center - lower, 1e-9)
+    falling = (upper - bin_freqs) / np.maximum(upper - center, 1e-9)
+    return np.maximum(0.0, np.minimum(rising, falling))
+
+
+class FeatureExtractor:
+    """
+    استخراج ميزات صوتية على دفعات (blocks) من الفريمات:
+    - log-mel spectrogram من STFT
+    - pitch بالـ autocorrelation (محسوبة من نفس الـ FFT ← Wiener–Khinchin)
+    - formants من LPC (Levinson-Durbin + جذور كثير الحدود عبر eigvals دفعة واحدة)
+
+    كل الـ buffers الداخلية محجوزة مرة واحدة في __init__ ويعاد استخدامها لكل block ولكل مقطع،
+    وحجم الـ FFT ثابت → نفس الـ plan المخزن داخليًا في pocketfft يُستخدم لكل الاستدعاءات.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_length: int = 1024,
+        hop_length: int = 256,
+        n_mels: int = 40,
+        fmin: float = 50.0,
+        fmax: float = None,
+        pitch_range: tuple[float, float] = (50.0, 1000.0),
+        voicing_threshold: float = 0.3,
+        lpc_order: int = None,
+        n_formants: int = 3,
+        block_frames: int = 256
+    ):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.n_formants = n_formants
+        self.block_frames = block_frames
+        self.voicing_threshold = voicing_threshold
+        self.lpc_order = lpc_order or int(2 + sample_rate / 1000)
+
+        # FFT بضعف طول الفريم → autocorrelation خطية (بدون التفاف دائري)
+        self.n_fft = 1 << int(np.ceil(np.log2(2 * frame_length)))
+        n_bins = self.n_fft // 2 + 1
+
+        self.window = np.hanning(frame_length)
+        self.mel_fb = _mel_filterbank(sample_rate, self.n_fft, n_mels, fmin, fmax or sample_rate / 2)
+        # pre-emphasis (1 - 0.97 z^-1) مطبق في مجال الطيف لحساب LPC فقط
+        omega = 2 * np.pi * np.arange(n_bins) / self.n_fft
+        self.preemph_gain = np.abs(1.0 - 0.97 * np.exp(-1j * omega)) ** 2
+
+        # pitch عالي (طيور/خفافيش) = دورة من عينات قليلة → الـ autocorrelation تُحسب على lags كسرية
+        # (zero padding للطيف) بحيث أقصر دورة فيها 16 نقطة على الأقل
+        self.acf_oversample = max(1, int(np.ceil(16 * pitch_range[1] / sample_rate)))
+        lag_rate = sample_rate * self.acf_oversample
+        self.min_lag = max(1, int(lag_rate / pitch_range[1]))
+        self.max_lag = min((frame_length - 1) * self.acf_oversample, int(lag_rate / pitch_range[0]))
+
+        # buffers محجوزة مسبقًا
+        self._frames = np.zeros((block_frames, self.n_fft))
+        self._power = np.empty((block_frames, n_bins))
+        self._scratch = np.empty((block_frames, n_bins))
+        self._companion = np.zeros((block_frames, self.lpc_order, self.lpc_order))
+        self._companion[:, np.arange(1, self.lpc_order), np.arange(self.lpc_order - 1)] = 1.0
+
+    def num_frames(self, num_samples: int) -> int:
+        return 1 + max(0, num_samples - self.frame_length) // self.hop_length
+
+    def _allocate(self, n_frames: int) -> dict:
+        return {
+            "mel": np.empty((n_frames, self.n_mels), dtype=np.float32),
+            "pitch": np.empty(n_frames, dtype=np.float32),
+            "voicing": np.empty(n_frames, dtype=np.float32),
+            "formants": np.empty((n_frames, self.n_formants), dtype=np.float32),
+        }
+
+    def _levinson(self, r: np.ndarray) -> np.ndarray:
+        """Levinson-Durbin متجه عبر كل فريمات الـ block → معاملات LPC (بدون a0=1)"""
+        n = r.shape[0]
+        order = self.lpc_order
+        a = np.zeros((n, order + 1))
+        a[:, 0] = 1.0
+        err = r[:, 0] + 1e-9
+        for i in range(1, order + 1):
+            acc = r[:, i] + np.einsum('nj,nj->n', a[:, 1:i], r[:, i - 1:0:-1])
+            k = -acc / err
+            a[:, 1:i] = a[:, 1:i] + k[:, None] * a[:, i - 1:0:-1]
+            a[:, i] = k
+            err = err * (1.0 - k * k)
+        return a[:, 1:]
+
+    def _formants(self, lpc: np.ndarray, out: np.ndarray):
+        n = lpc.shape[0]
+        companion = self._companion[:n]
+        companion[:, 0, :] = -lpc
+        roots = np.linalg.eigvals(companion)
+
+        angles = np.angle(roots)
+        freqs = angles * self.sample_rate / (2 * np.pi)
+        bandwidths = -np.log(np.maximum(np.abs(roots), 1e-9)) * self.sample_rate / np.pi
+        valid = (np.imag(roots) > 0) & (freqs > 90.0) & (bandwidths < 400.0)
+
+        freqs = np.sort(np.where(valid, freqs, np.inf), axis=1)[:, :self.n_formants]
+        if freqs.shape[1] < self.n_formants:
+            freqs = np.pad(freqs, ((0, 0), (0, self.n_formants - freqs.shape[1])), constant_values=np.inf)
+        out[:] = np.where(np.isfinite(freqs), freqs, 0.0)
+
+    def _process_block(self, windows: np.ndarray, out: dict, start: int):
+        n = windows.shape[0]
+        frames = self._frames[:n]
+        power = self._power[:n]
+        scratch = self._scratch[:n]
+
+        np.multiply(windows, self.window, out=frames[:, :self.frame_length])
+        spectrum = np.fft.rfft(frames, axis=1)
+        np.multiply(spectrum.real, spectrum.real, out=power)
+        np.multiply(spectrum.imag, spectrum.imag, out=scratch)
+        power += scratch
+
+        # ─── mel ────────────────────────────────────────────────────────
+        mel = power @ self.mel_fb.T
+        np.log(mel + 1e-10, out=mel)
+        out["mel"][start:start + n] = mel
+
+        # ─── pitch (autocorrelation) ────────────────────────────────────
+        acf = np.fft.irfft(power, n=self.n_fft * self.acf_oversample, axis=1)
+        if self.acf_oversample > 1:
+            acf *= self.acf_oversample
+        energy = np.maximum(acf[:, 0], 1e-12)
+        lags = acf[:, self.min_lag:self.max_lag + 1] / energy[:, None]
+        best = np.argmax(lags, axis=1)
+        peak = lags[np.arange(n), best]
+
+        # تنعيم parabolic حول القمة
+        left = lags[np.arange(n), np.maximum(best - 1, 0)]
+        right = lags[np.arange(n), np.minimum(best + 1, lags.shape[1] - 1)]
+        denom = left - 2 * peak + right
+        # قمة على حافة المدى ما لها جار من الجهتين → بدون تنعيم (وإلا يطلع pitch خارج pitch_range)
+        interior = (best > 0) & (best < lags.shape[1] - 1) & (np.abs(denom) > 1e-12)
+        shift = np.where(interior, 0.5 * (left - right) / np.where(denom == 0, 1, denom), 0.0)
+        lag = self.min_lag + best + np.clip(shift, -0.5, 0.5)
+
+        voiced = (peak > self.voicing_threshold) & (acf[:, 0] > 1e-8)
+        out["pitch"][start:start + n] = np.where(voiced, self.sample_rate * self.acf_oversample / lag, 0.0)
+        out["voicing"][start:start + n] = peak
+
+        # ─── formants (LPC) ─────────────────────────────────────────────
+        np.multiply(power, self.preemph_gain, out=scratch)
+        lpc_acf = np.fft.irfft(scratch, n=self.n_fft, axis=1)[:, :self.lpc_order + 1]
+        self._formants(self._levinson(lpc_acf), out["formants"][start:start + n])
+
+    def _extract_into(self, audio: np.ndarray, out: dict):
+        audio = np.asarray(audio, dtype=np.float64).ravel()
+        if audio.size < self.frame_length:
+            audio = np.pad(audio, (0, self.frame_length - audio.size))
+
+        windows = np.lib.stride_tricks.sliding_window_view(audio, self.frame_length)[::self.hop_length]
+        for start in range(0, windows.shape[0], self.block_frames):
+            self._process_block(windows[start:start + self.block_frames], out, start)
+
+    def extract(self, audio: np.ndarray) -> dict:
+        """استخراج الميزات لمقطع واحد → dict من المصفوفات + times بالثواني"""
+        n_frames = self.num_frames(max(len(audio), self.frame_length))
+        out = self._allocate(n_frames)
+        self._extract_into(audio, out)
+        out["times"] = (np.arange(n_frames) * self.hop_length / self.sample_rate).astype(np.float32)
+        return out
+
+    def extract_batch(self, clips: list[np.ndarray]) -> list[dict]:
+        """
+        استخراج لعدة مقاطع: مصفوفات الإخراج تُحجز مرة واحدة للدفعة كاملة
+        وكل مقطع يرجع views (slices) منها
+        """
+        counts = [self.num_frames(max(len(clip), self.frame_length)) for clip in clips]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+        storage = self._allocate(int(offsets[-1]))
+        times = (np.arange(max(counts, default=0)) * self.hop_length / self.sample_rate).astype(np.float32)
+
+        results = []
+        for clip, lo, hi in zip(clips, offsets[:-1], offsets[1:]):
+            out = {key: arr[lo:hi] for key, arr in storage.items()}
+            self._extract_into(clip, out)
+            out["times"] = times[:hi - lo]
+            results.append(out)
+        return results
+
+    @staticmethod
+    def summarize(features: dict) -> dict:
+        """ملخص قابل للحفظ في JSON (بدون المصفوفات الكاملة)"""
+        pitch = features["pitch"]
+        voiced = pitch[pitch > 0]
+        formants = features["formants"]
+        return {
+            "num_frames": int(len(pitch)),
+            "voiced_ratio": float(len(voiced) / max(1, len(pitch))),
+            "pitch_mean_hz": float(voiced.mean()) if len(voiced) else 0.0,
+            "pitch_median_hz": float(np.median(voiced)) if len(voiced) else 0.0,
+            "formants_median_hz": [
+                float(np.median(col[col > 0])) if np.any(col > 0) else 0.0
+                for col in formants.T
+            ],
+            "mel_mean": [round(float(v), 3) for v in features["mel"].mean(axis=0)] if len(pitch) else [],
+        }
+
+
+_FEATURE_EXTRACTORS = {}
+
+
+def get_feature_extractor(
+    sample_rate: int = 16000,
+    pitch_range: tuple[float, float] = (50.0, 1000.0)
+) -> FeatureExtractor:
+    """extractor واحد لكل (sample_rate, pitch_range) (الـ buffers والفلاتر تُبنى مرة واحدة)"""
+    key = (sample_rate, (float(pitch_range[0]), float(pitch_range[1])))
+    if key not in _FEATURE_EXTRACTORS:
+        _FEATURE_EXTRACTORS[key] = FeatureExtractor(sample_rate=sample_rate, pitch_range=key[1])
+    return _FEATURE_EXTRACTORS[key]
+
 # ─── دالة تطبيق ميزات AI (أكثر ذكاءً ومرونة) ────────────────
-def apply_ai_features(data: list | dict, ai_type: str = 'physical') -> dict:
+def apply_ai_features(
+    data: list | dict,
+    ai_type: str = 'physical',
+    audio: np.ndarray = None,
+    sample_rate: int = 16000
+) -> dict:
     """
     تطبيق وصف ميزات AI بناءً على نوع البيانات المدخلة
+    - ai_type='feature_extraction' → استخراج فعلي للميزات من audio
+      (أو من نداء اصطناعي مولد إذا كانت البيانات آلية حيوانية بدون audio)
     """
     data_type = "human_speech" if isinstance(data, list) else "animal_mechanism"
 
@@ -440,32 +1046,220 @@ def apply_ai_features(data: list | dict, ai_type: str = 'physical') -> dict:
 
     desc = descriptions.get(ai_type, "تطبيق AI مدمج/غير محدد")
 
-    return {
+    result = {
         "ai_type": ai_type,
         "description": desc,
         "data_type": data_type,
         "input_summary": f"{len(data)} عنصر" if isinstance(data, list) else "وصف آلية واحدة"
     }
 
-# ─── دالة رئيسية لمعالجة نص بشري (معدلة لتدعم القيم العددية) ────────────────
-def process_human_text(
-    text: str,
-    language: str = 'eng',
-    output_file: str = None,
-    ai_type: str = 'physical',
-    emotion: str = 'neutral'   # ← إضافة مهمة جدًا
-) -> dict:
+    if ai_type == 'feature_extraction':
+        animal_type = data.get('animal_type') if isinstance(data, dict) else None
+        pitch_range = (50.0, 1000.0)
+        if audio is None and animal_type in ANIMAL_SYNTH_TEMPLATES:
+            sample_rate = 22050
+            rng = np.random.default_rng(0)
+            params = sample_animal_params(animal_type, 1, rng)
+            calls, lengths = synthesize_animal_calls(animal_type, params, sample_rate, rng)
+            audio = calls[0, :lengths[0]]
+        if animal_type in ANIMAL_SYNTH_TEMPLATES:
+            # نداءات الطيور/الخفافيش/الحشرات أعلى بكثير من مدى الكلام البشري
+            pitch_range = animal_pitch_range(animal_type, sample_rate)
+
+        if audio is not None:
+            features = get_feature_extractor(sample_rate, pitch_range).extract(audio)
+            result["features"] = FeatureExtractor.summarize(features)
+            result["sample_rate"] = sample_rate
+            result["pitch_range"] = list(pitch_range)
+        else:
+            logger.warning("feature_extraction بدون audio → وصف فقط")
+
+    return result
+
+# ─── تقسيم الجمل/العبارات + prosody (وقفات ونبر) بالـ POS tagger ────────────────
+# الـ tagger المرفق مع المشروع (averaged_perceptron_tagger.zip)
+TAGGER_ZIP = Path(__file__).with_name("averaged_perceptron_tagger.zip")
+TAGGER_PICKLE = "averaged_perceptron_tagger/averaged_perceptron_tagger.pickle"
+
+SENTENCE_END = re.compile(r"[.!?؟]+$")
+CLAUSE_END = re.compile(r"[,;:،؛]+$")
+TOKEN_PUNCT = ",.!?;:،؛؟\"'()"
+
+# مدد بوحدة الفريم (FRAME_DURATION_SEC)
+SENTENCE_PAUSE_FRAMES = 4
+CLAUSE_PAUSE_FRAMES = 2
+STRESS_HOLD_FRAMES = 1
+
+# كلمات المحتوى (تأخذ نبر): أسماء، أفعال، صفات، ظروف
+CONTENT_TAG_PREFIXES = ('NN', 'VB', 'JJ', 'RB', 'CD', 'UH')
+
+# لو ما في tagger نهائيًا → أي كلمة مش من هذي القائمة تُعتبر كلمة محتوى
+FUNCTION_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'of', 'to', 'in', 'on', 'at', 'for', 'with', 'by', 'from',
+    'is', 'are', 'was', 'were', 'be', 'been', 'am', 'it', 'this', 'that', 'i', 'you', 'he', 'she',
+    'we', 'they', 'his', 'her', 'its', 'our', 'their', 'my', 'your', 'as', 'if', 'so', 'not',
+}
+
+_POS_TAGGER = None
+
+
+def _load_pos_tagger():
+    from nltk.tag.perceptron import PerceptronTagger
+
+    if TAGGER_ZIP.exists():
+        try:
+            with zipfile.ZipFile(TAGGER_ZIP) as zf:
+                weights, tagdict, classes = pickle.loads(zf.read(TAGGER_PICKLE), encoding='latin1')
+            tagger = PerceptronTagger(load=False)
+            tagger.model.weights = weights
+            tagger.model.classes = classes
+            tagger.tagdict = tagdict
+            tagger.classes = classes
+            return tagger
+        except Exception as e:
+            logger.warning(f"فشل تحميل الـ tagger من {TAGGER_ZIP.name}: {e}")
+
+    # من nltk.data.path (مثلًا C:\nltk_data)
+    return PerceptronTagger()
+
+
+def get_pos_tagger():
+    """الـ tagger يُحمّل مرة واحدة لكل عملية (None لو غير متاح → تصنيف بسيط بالقائمة)"""
+    global _POS_TAGGER
+    if _POS_TAGGER is None:
+        try:
+            _POS_TAGGER = _load_pos_tagger()
+        except Exception as e:
+            logger.warning(f"POS tagger غير متاح → استخدام FUNCTION_WORDS: {e}")
+            _POS_TAGGER = False
+    return _POS_TAGGER or None
+
+
+def segment_text(text: str) -> list[list[list[str]]]:
+    """تقسيم النص → جمل → عبارات → كلمات (الكلمات كما هي مع علامات الترقيم)"""
+    sentences = [[[]]]
+    for token in text.split():
+        sentences[-1][-1].append(token)
+        if SENTENCE_END.search(token):
+            sentences.append([[]])
+        elif CLAUSE_END.search(token):
+            sentences[-1].append([])
+    # إزالة العبارات/الجمل الفاضية في الآخر
+    sentences = [[clause for clause in sentence if clause] for sentence in sentences]
+    return [sentence for sentence in sentences if sentence]
+
+
+def plan_prosody(text: str) -> list[dict]:
     """
-    معالجة نص بشري كامل → phonemes → visemes → حركات عددية + وصفية
+    خطة prosody لكل كلمة (بنفس ترتيب text.split()):
+    word, pos, stress, boundary (sentence/clause/None), pause_frames, hold_frames
     """
-    phonemes = text_to_phonemes(text, language)
+    tagger = get_pos_tagger()
+    plan = []
+    for sentence in segment_text(text):
+        tokens = [token for clause in sentence for token in clause]
+        bare = [token.strip(TOKEN_PUNCT) or token for token in tokens]
+        if tagger is not None:
+            tags = [tag for _, tag in tagger.tag(bare)]
+        else:
+            tags = ['DT' if word.lower() in FUNCTION_WORDS else 'NN' for word in bare]
+
+        for token, tag in zip(tokens, tags):
+            if SENTENCE_END.search(token):
+                boundary, pause = 'sentence', SENTENCE_PAUSE_FRAMES
+            elif CLAUSE_END.search(token):
+                boundary, pause = 'clause', CLAUSE_PAUSE_FRAMES
+            else:
+                boundary, pause = None, 0
+            # أفعال مساعدة (is, are, ...) تأخذ VB لكنها بدون نبر
+            stress = tag.startswith(CONTENT_TAG_PREFIXES) and clean_word(token) not in FUNCTION_WORDS
+            plan.append({
+                "word": clean_word(token),
+                "pos": tag,
+                "stress": stress,
+                "boundary": boundary,
+                "pause_frames": pause,
+                "hold_frames": STRESS_HOLD_FRAMES if stress else 0,
+            })
+    return plan
+
+
+def plan_lexical_stress(text: str) -> list[dict]:
+    """
+    خطة بدون prosody (بدون وقفات/إطالة) بنفس شكل plan_prosody
+    stress=None → يُحدد من النبر المعجمي في فونيمات الكلمة داخل build_prosodic_movements
+    """
+    return [
+        {"word": clean_word(token), "stress": None, "pause_frames": 0, "hold_frames": 0}
+        for token in text.lower().split()
+    ]
+
+
+def _init_prosody_worker():
+    get_pos_tagger()
 
-    # استخدام النسخة المحسنة اللي اقترحناها قبل
-    viseme_items = phonemes_to_visemes(phonemes, emotion=emotion)
 
-    # تحويل إلى animation_sequence متوافق مع الـ visualizer
+def plan_prosody_batch(texts: list[str], workers: int = 1, chunksize: int = 16) -> list[list[dict]]:
+    """
+    plan_prosody لعدة مستندات
+    - workers=1 → في نفس العملية (الـ tagger محمّل مرة واحدة)
+    - workers>1 → ProcessPoolExecutor، الـ tagger يُحمّل مرة واحدة لكل عامل عبر initializer
+    """
+    if workers == 1:
+        return [plan_prosody(text) for text in texts]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_prosody_worker) as pool:
+        return list(pool.map(plan_prosody, texts, chunksize=chunksize))
+
+
+def build_prosodic_movements(
+    plan: list[dict],
+    emotion: str = 'neutral',
+    language: str = 'eng'
+) -> tuple[list[dict], list[dict]]:
+    """
+    بناء animation_sequence كلمة بكلمة مع إدخال:
+    - hold_frames: تكرار أكثر فريم مفتوح في الكلمة المنبورة (إطالة)
+    - pause_frames: فريمات صمت بعد نهاية العبارة/الجملة
+    - stress=None → النبر المعجمي ('1' في فونيمات الكلمة)
+    يرجع (movements, plan مع onset/frames/stress لكل كلمة)
+    """
+    words = [item["word"] for item in plan]
+    resolve_oov_words(words, language)
+
+    viseme_items = []
+    timed_plan = []
+    for idx, item in enumerate(plan):
+        phonemes = word_to_phonemes(item["word"])
+        segment = phonemes.rstrip() if idx == len(plan) - 1 else phonemes + " "
+        word_items = annotate_animation_keys(segment, phonemes_to_visemes(segment, emotion=emotion))
+
+        if item["hold_frames"] and word_items:
+            peak = max(range(len(word_items)),
+                       key=lambda i: word_items[i]['params']['mouth_open'] + word_items[i]['params']['jaw_open'])
+            word_items[peak + 1:peak + 1] = [word_items[peak]] * item["hold_frames"]
+        if item["pause_frames"]:
+            word_items += phonemes_to_visemes(" " * item["pause_frames"], emotion=emotion)
+
+        stress = item.get("stress")
+        if stress is None:
+            stress = has_primary_stress(phonemes)
+        timed_plan.append({**item, "stress": stress, "onset": len(viseme_items), "frames": len(word_items)})
+        viseme_items.extend(word_items)
+
+    return viseme_items_to_movements(viseme_items), timed_plan
+
+# ─── تحويل viseme items → animation_sequence + تجميع النتيجة ────────────────
+def save_result_json(result: dict, output_file: str = None):
+    if output_file:
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        logger.info(f"تم حفظ النتيجة في: {output_file}")
+
+
+def viseme_items_to_movements(viseme_items: list[dict], start_step: int = 0) -> list[dict]:
     movements = []
-    for idx, item in enumerate(viseme_items):
+    for idx, item in enumerate(viseme_items, start_step):
         params = item['params']
         movements.append({
             "time_step": idx,
@@ -481,32 +1275,544 @@ def process_human_text(
             "jaw": params.get('jaw', 'closed'),
             "tongue": params.get('tongue', 'rest'),
             "face_expression": params.get('face', 'neutral'),
+            # مفتاح VISeme_ANIMATION_HUMAN (قنوات face/body في gesture_track)
+            "animation_key": params.get('animation_key')
+                or VISEME_TO_ANIMATION_KEY.get(params.get('viseme_category', 'sil'), 'SIL'),
         })
+    return movements
 
-    ai_features = apply_ai_features(movements, ai_type)
 
-    result = {
+def build_human_result(
+    text: str,
+    language: str,
+    emotion: str,
+    phonemes: str,
+    movements: list[dict],
+    ai_type: str = 'physical',
+    audio: np.ndarray = None,
+    sample_rate: int = 16000,
+    beats: list[int] = None,
+    gesture_track: dict = None,
+    viseme_sequence: list[str] = None
+) -> dict:
+    if gesture_track is None:
+        gesture_track = generate_gesture_track(movements, beats)
+    if viseme_sequence is None:
+        viseme_sequence = [frame['phoneme'] for frame in movements]
+    return {
         "original_text": text,
         "language": language,
         "emotion": emotion,
         "phonemes": phonemes,
-        "viseme_sequence": [item['phoneme'] for item in viseme_items],  # أو احتفظ بالتفاصيل كاملة
+        "viseme_sequence": viseme_sequence,  # أو احتفظ بالتفاصيل كاملة
         "animation_sequence": movements,
-        "ai_features": ai_features,
+        "gesture_track": gesture_track,
+        "ai_features": apply_ai_features(movements, ai_type, audio=audio, sample_rate=sample_rate),
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    if output_file:
-        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"تم حفظ النتيجة في: {output_file}")
+# ─── دالة رئيسية لمعالجة نص بشري (معدلة لتدعم القيم العددية) ────────────────
+def process_human_text(
+    text: str,
+    language: str = 'eng',
+    output_file: str = None,
+    ai_type: str = 'physical',
+    emotion: str = 'neutral',   # ← إضافة مهمة جدًا
+    prosody: bool = False,
+    prosody_plan: list[dict] = None,
+    store: "ResultStore" = None,
+    audio: np.ndarray = None,
+    sample_rate: int = 16000
+) -> dict:
+    """
+    معالجة نص بشري كامل → phonemes → visemes → حركات عددية + وصفية
+    - prosody=True → وقفات ونبر من plan_prosody داخل الـ timeline
+    - prosody_plan → خطة محسوبة مسبقًا (مثلًا من plan_prosody_batch)
+    - audio/sample_rate → تسجيل النص، يُمرر لـ apply_ai_features (ai_type='feature_extraction')
+    - store → إذا النتيجة موجودة مسبقًا (نفس المدخلات + نفس نسخة الجداول) ترجع بدون إعادة حساب
+    """
+    key = None
+    if store is not None:
+        key = human_result_key(text, language, emotion, ai_type, prosody=prosody, prosody_plan=prosody_plan,
+                               audio=audio, sample_rate=sample_rate)
+        cached = store.get(key)
+        if cached is not None:
+            save_result_json(cached, output_file)
+            return cached
+
+    phonemes = text_to_phonemes(text, language)
+
+    if prosody_plan is None and prosody and text.strip():
+        prosody_plan = plan_prosody(text)
+
+    if prosody_plan:
+        movements, prosody_plan = build_prosodic_movements(prosody_plan, emotion=emotion, language=language)
+        beats = stress_beats(prosody_plan)
+    elif text.strip():
+        # كلمة بكلمة (نفس الفريمات) عشان نعرف onset كل كلمة منبورة لمسار الإيماءات
+        movements, timed_plan = build_prosodic_movements(plan_lexical_stress(text), emotion=emotion, language=language)
+        beats = stress_beats(timed_plan)
+    else:
+        # استخدام النسخة المحسنة اللي اقترحناها قبل
+        viseme_items = phonemes_to_visemes(phonemes, emotion=emotion)
+
+        # تحويل إلى animation_sequence متوافق مع الـ visualizer
+        movements = viseme_items_to_movements(viseme_items)
+        beats = []
+
+    result = build_human_result(text, language, emotion, phonemes, movements, ai_type, audio, sample_rate, beats)
+    if prosody_plan:
+        result["prosody"] = prosody_plan
+
+    if store is not None:
+        store.put(key, result)
+    save_result_json(result, output_file)
 
     return result
 
+# ─── معالجة تزايدية (incremental) لنص يتم تعديله كلمة بكلمة ────────────────
+def _common_prefix(old: list, new: list, chunk: int = 256) -> int:
+    """طول البادئة المشتركة - المقارنة بـ slices (داخل C) والمرور بايثون فقط داخل أول chunk مختلف"""
+    limit = min(len(old), len(new))
+    idx = 0
+    while idx < limit:
+        stop = min(limit, idx + chunk)
+        if old[idx:stop] != new[idx:stop]:
+            while old[idx] == new[idx]:
+                idx += 1
+            return idx
+        idx = stop
+    return limit
+
+
+def _common_suffix(old: list, new: list, limit: int, chunk: int = 256) -> int:
+    """طول اللاحقة المشتركة (بحد أقصى limit) بنفس أسلوب _common_prefix"""
+    n_old, n_new = len(old), len(new)
+    idx = 0
+    while idx < limit:
+        stop = min(limit, idx + chunk)
+        if old[n_old - stop:n_old - idx] != new[n_new - stop:n_new - idx]:
+            while old[n_old - 1 - idx] == new[n_new - 1 - idx]:
+                idx += 1
+            return idx
+        idx = stop
+    return limit
+
+
+class _FrameOffsets:
+    """
+    عدد الفريمات لكل كلمة مقسم على blocks (≤ 2 * BLOCK كلمة) + Fenwick tree على مجاميع الـ blocks
+    - offset(i) = أول فريم للكلمة i ← O(log blocks + BLOCK)
+    - replace(lo, hi, counts) = استبدال نطاق كلمات ← نفس التكلفة (إعادة بناء الشجرة فقط عند تقسيم block)
+    """
+
+    BLOCK = 256
+
+    def __init__(self, counts: list[int] = ()):
+        counts = list(counts)
+        self.blocks = [counts[i:i + self.BLOCK] for i in range(0, len(counts), self.BLOCK)] or [[]]
+        self._rebuild()
+
+    def _rebuild(self):
+        size = len(self.blocks) + 1
+        self._words = [0] * size
+        self._frames = [0] * size
+        for idx, block in enumerate(self.blocks):
+            self._add(idx, len(block), sum(block))
+
+    def _add(self, block_idx: int, words: int, frames: int):
+        i = block_idx + 1
+        while i < len(self._words):
+            self._words[i] += words
+            self._frames[i] += frames
+            i += i & -i
+
+    @staticmethod
+    def _prefix(tree: list[int], block_idx: int) -> int:
+        total = 0
+        i = block_idx
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """(block، موقع داخل الـ block) للكلمة index - index == عدد الكلمات → نهاية آخر block"""
+        n_blocks = len(self.blocks)
+        pos, remaining = 0, index
+        step = 1 << n_blocks.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n_blocks and self._words[nxt] <= remaining:
+                pos = nxt
+                remaining -= self._words[nxt]
+            step >>= 1
+        if pos == n_blocks:
+            return n_blocks - 1, len(self.blocks[-1])
+        return pos, remaining
+
+    @property
+    def total(self) -> int:
+        return self._prefix(self._frames, len(self.blocks))
+
+    def offset(self, index: int) -> int:
+        block_idx, inner = self._locate(index)
+        return self._prefix(self._frames, block_idx) + sum(self.blocks[block_idx][:inner])
+
+    def replace(self, lo: int, hi: int, counts: list[int]):
+        first, inner = self._locate(lo)
+        last, covered = first, len(self.blocks[first]) - inner
+        while covered < hi - lo:
+            last += 1
+            covered += len(self.blocks[last])
+
+        old = self.blocks[first] if first == last else [c for block in self.blocks[first:last + 1] for c in block]
+        merged = old[:inner] + list(counts) + old[inner + hi - lo:]
+        if first == last and 0 < len(merged) <= 2 * self.BLOCK:
+            self.blocks[first] = merged
+            self._add(first, len(merged) - len(old), sum(merged) - sum(old))
+            return
+
+        self.blocks[first:last + 1] = [merged[i:i + self.BLOCK] for i in range(0, len(merged), self.BLOCK)]
+        if not self.blocks:
+            self.blocks = [[]]
+        self._rebuild()
+
+    def counts(self) -> np.ndarray:
+        return np.fromiter(chain.from_iterable(self.blocks), dtype=np.int64)
+
+
+class IncrementalTextProcessor:
+    """
+    يحتفظ بالربط كلمة → فونيمات → فريمات، وعند كل تعديل:
+    - يقارن كلمات النص الجديد بالقديمة (بادئة + لاحقة مشتركة، المقارنة داخل C)
+    - يعيد حساب الكلمات المتغيرة فقط + margin كلمات حولها (coarticulation)
+    - يستبدلها داخل animation_sequence وأرقام الإيماءات لكل فريم (slice assignment)
+    - offset الكلمة من _FrameOffsets → زمن التعديل ما يكبر مع طول المستند
+
+    الواجهة التزايدية هي ناتج update(): نطاق الفريمات المستبدلة + الفريمات الجديدة
+    (time_step ضمني = موقع الفريم، والفريمات المخزنة ما تُعدّل بعد التعديل)
+    result() يبني نسخة كاملة → O(طول المستند)، لا تستدعيها بعد كل ضغطة مفتاح
+    النتيجة (result) مطابقة لـ process_human_text على نفس النص (ما عدا timestamp)
+    """
+
+    def __init__(self, language: str = 'eng', emotion: str = 'neutral', ai_type: str = 'physical', margin: int = 1):
+        self.language = language
+        self.emotion = emotion
+        self.ai_type = ai_type
+        self.margin = margin
+
+        self.text = ""
+        self.tokens = []         # كلمات النص كما هي (text.split()) ← للمقارنة
+        self.words = []          # الكلمات بعد clean_word
+        self.segments = []       # فونيمات كل كلمة + الفاصل ' ' (آخر كلمة بدون فاصل)
+        self.stresses = []       # نبر معجمي لكل كلمة (لقناة beat)
+        self.offsets = _FrameOffsets()
+        self.movements = []           # time_step هنا ممكن يكون قديم → الموقع هو المرجع
+        self.visemes = []             # viseme_sequence (phoneme لكل فريم)
+        self.face_ids = bytearray()   # رقم إيماءة الوجه لكل فريم
+        self.body_ids = bytearray()   # رقم إيماءة الجسم لكل فريم
+
+    def _segment(self, word: str, is_last: bool) -> str:
+        phonemes = word_to_phonemes(word)
+        # نفس " ".join(...).strip() في text_to_phonemes
+        return phonemes.rstrip() if is_last else phonemes + " "
+
+    def _compute(self, words: list[str], first_index: int, total: int, start_step: int):
+        resolve_oov_words(words, self.language)
+        segments, counts, stresses, movements = [], [], [], []
+        for offset, word in enumerate(words):
+            segment = self._segment(word, first_index + offset == total - 1)
+            frames = viseme_items_to_movements(
+                annotate_animation_keys(segment, phonemes_to_visemes(segment, emotion=self.emotion)),
+                start_step + len(movements)
+            )
+            segments.append(segment)
+            counts.append(len(frames))
+            stresses.append(has_primary_stress(segment))
+            movements.extend(frames)
+        return segments, counts, stresses, movements
+
+    def set_text(self, text: str) -> dict:
+        """بناء كامل (أول مرة أو إعادة ضبط)"""
+        self.text = text
+        self.tokens = text.split()
+        self.words = [clean_word(token) for token in self.tokens]
+        self.segments, counts, self.stresses, self.movements = self._compute(self.words, 0, len(self.words), 0)
+        self.offsets = _FrameOffsets(counts)
+        self.visemes = [frame['phoneme'] for frame in self.movements]
+        self.face_ids = bytearray(frame_gesture_ids(self.movements, 'face'))
+        self.body_ids = bytearray(frame_gesture_ids(self.movements, 'body'))
+        return {
+            "words": (0, 0, len(self.words)),
+            "frames": (0, 0, len(self.movements)),
+            "movements": list(self.movements),
+        }
+
+    def update(self, new_text: str) -> dict:
+        """
+        تطبيق تعديل → يرجع التغيير (splice) بدل النتيجة الكاملة:
+        words=(lo, عدد الكلمات المحذوفة, عدد المضافة), frames=(أول فريم, المحذوفة, المضافة)
+        movements=الفريمات الجديدة (تحل محل frames[lo:lo+المحذوفة])
+        المستهلك يطبقها على نسخته: seq[lo:lo + removed] = movements
+        ثم time_step لكل فريم = موقعه (الفريمات بعد التعديل تحركت بـ added - removed)
+        """
+        tokens = new_text.split()
+        n_old, n_new = len(self.tokens), len(tokens)
+        prefix = _common_prefix(self.tokens, tokens)
+        suffix = _common_suffix(self.tokens, tokens, min(n_old, n_new) - prefix)
+
+        self.text = new_text
+        if prefix == n_old == n_new:
+            return {"words": (n_new, 0, 0), "frames": (len(self.movements), 0, 0), "movements": []}
+
+        lo = max(0, prefix - self.margin)
+        hi_old = min(n_old, n_old - suffix + self.margin)
+        if hi_old == n_old:
+            # التغيير يلمس آخر النص → آخر كلمة (قديمة/جديدة) يتغير فاصلها
+            lo = max(0, min(lo, n_old - 1, n_new - 1))
+        hi_new = hi_old + (n_new - n_old)
+
+        frame_lo = self.offsets.offset(lo)
+        frame_hi = self.offsets.offset(hi_old)
+
+        words = [clean_word(token) for token in tokens[lo:hi_new]]
+        segments, counts, stresses, movements = self._compute(words, lo, n_new, frame_lo)
+        self.tokens = tokens
+        self.words[lo:hi_old] = words
+        self.segments[lo:hi_old] = segments
+        self.stresses[lo:hi_old] = stresses
+        self.offsets.replace(lo, hi_old, counts)
+        self.movements[frame_lo:frame_hi] = movements
+        self.visemes[frame_lo:frame_hi] = [frame['phoneme'] for frame in movements]
+        self.face_ids[frame_lo:frame_hi] = frame_gesture_ids(movements, 'face')
+        self.body_ids[frame_lo:frame_hi] = frame_gesture_ids(movements, 'body')
+
+        return {
+            "words": (lo, hi_old - lo, hi_new - lo),
+            "frames": (frame_lo, frame_hi - frame_lo, len(movements)),
+            "movements": list(movements),
+        }
+
+    def result(self) -> dict:
+        """
+        تجميع النتيجة الكاملة بنفس شكل process_human_text
+        - O(طول المستند): نسخ كل الفريمات + time_step من موقعها
+        - النتيجة نسخة مستقلة → update() بعدها ما يغير شيء عند المستدعي
+        """
+        if not self.words:
+            return process_human_text(self.text, self.language, ai_type=self.ai_type, emotion=self.emotion)
+
+        movements = [{**frame, "time_step": step} for step, frame in enumerate(self.movements)]
+
+        counts = self.offsets.counts()
+        onsets = np.cumsum(counts) - counts
+        beats = onsets[np.array(self.stresses, dtype=bool)].tolist()
+        gesture_track = build_gesture_track(self.face_ids, self.body_ids, beats)
+
+        phonemes = "".join(self.segments)
+        return build_human_result(
+            self.text, self.language, self.emotion, phonemes, movements, self.ai_type,
+            gesture_track=gesture_track, viseme_sequence=list(self.visemes)
+        )
+
+# ─── تسليم الفريمات لعمليات العرض عبر shared memory ────────────────
+# جدول ثابت: فئة viseme → رقم صغير (يُستخدم في سجلات الـ ring)
+VISEME_CATEGORIES = sorted(set(PHONEME_TO_VISEME.values()) | set(VISEME_DETAILS))
+VISEME_CODES = {category: idx for idx, category in enumerate(VISEME_CATEGORIES)}
+
+
+def frame_ring_metadata() -> dict:
+    """metadata تُكتب في الـ ring مرة واحدة → الـ renderer ما يحتاج يستورد human_speech"""
+    return {
+        "categories": VISEME_CATEGORIES,
+        "details": {
+            category: {k: base[k] for k in ('lips', 'jaw', 'tongue', 'face')}
+            for category, base in VISEME_DETAILS.items()
+        },
+    }
+
+
+def movements_to_frame_records(movements: list[dict], stream_id: int = 0) -> np.ndarray:
+    """animation_sequence → مصفوفة float32 بتخطيط speech_frame_ring.FRAME_FIELDS"""
+    records = np.zeros((len(movements), RECORD_FLOATS), dtype=np.float32)
+    for row, frame in zip(records, movements):
+        row[0] = frame.get('time_step', 0)
+        row[1] = frame.get('mouth_open', 0.0)
+        row[2] = frame.get('jaw_open', 0.0)
+        row[3] = frame.get('lip_round', 0.0)
+        row[4] = frame.get('lip_spread', 0.0)
+        row[5] = VISEME_CODES.get(frame.get('viseme_category', 'sil'), VISEME_CODES['sil'])
+    records[:, 6] = stream_id
+    return records
+
+
+_RING_PRODUCER = None
+_RING_WRITE_TIMEOUT = None
+
+
+def _init_ring_producer(ring_name: str, lock, write_timeout: float = None):
+    global _RING_PRODUCER, _RING_WRITE_TIMEOUT
+    _RING_PRODUCER = SharedFrameRing.attach(ring_name, lock=lock)
+    _RING_WRITE_TIMEOUT = write_timeout
+
+
+def _produce_to_ring(job: tuple) -> tuple[int, int]:
+    stream_id, text, language, emotion = job
+    phonemes = text_to_phonemes(text, language)
+    movements = viseme_items_to_movements(phonemes_to_visemes(phonemes, emotion=emotion))
+    # كل نص يُكتب دفعة واحدة تحت الـ lock → فريمات النصوص ما تتداخل
+    _RING_PRODUCER.write(movements_to_frame_records(movements, stream_id), timeout=_RING_WRITE_TIMEOUT)
+    return stream_id, len(movements)
+
+
+def feed_frame_ring(
+    ring_name: str,
+    items: list[dict],
+    lock,
+    workers: int = None,
+    readers: int = 1,
+    ready_timeout: float = None,
+    close: bool = True,
+    write_timeout: float = 30.0
+) -> list[tuple[int, int]]:
+    """
+    توليد الحركات لعدة نصوص داخل ProcessPoolExecutor وكتابتها مباشرة في الـ ring
+    - items: [{"text": ..., "language": ..., "emotion": ...}]
+    - lock: multiprocessing.Lock مشترك بين كل الكتّاب
+    - ينتظر تسجيل readers قارئ (wait_for_readers) قبل أول كتابة → القارئ ما يفوّت فريمات
+      (ready_timeout ينتهي بدون قراء → TimeoutError)
+    - write_timeout: أقصى انتظار لمساحة في الـ ring لكل نص → TimeoutError لو القارئ علق
+      (وكل القراء غادروا → BrokenPipeError فورًا)
+    - close=True → close_writer() بعد آخر نص عشان القراء يخلصون؛
+      close=False لو فيه كتابات ثانية جاية، والمستدعي لازم يستدعي close_writer() بنفسه
+    - يرجع [(stream_id, عدد الفريمات)] - stream_id = ترتيب النص في items
+    """
+    jobs = [
+        (idx, item["text"], item.get("language", 'eng'), item.get("emotion", 'neutral'))
+        for idx, item in enumerate(items)
+    ]
+    ring = SharedFrameRing.attach(ring_name, lock=lock)
+    try:
+        if not ring.wait_for_readers(readers, timeout=ready_timeout):
+            raise TimeoutError(f"ما تسجل {readers} قارئ على الـ ring خلال {ready_timeout} ثانية")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_ring_producer,
+                                 initargs=(ring_name, lock, write_timeout)) as pool:
+            produced = list(pool.map(_produce_to_ring, jobs))
+    finally:
+        # حتى لو فشلت الكتابة → القراء الباقين ما ينتظرون للأبد
+        if close:
+            ring.close_writer()
+        ring.close()
+    return produced
+
+# ─── صيغة مضغوطة (quantized int8/int16 + delta) للبث للعملاء الخفيفين ────────────────
+# header: magic, version, bits, channels, reserved, n_frames, table_id, scale لكل قناة
+# بعده: لكل قناة مصفوفة deltas (int8/int16)، ثم كود الفئة لكل فريم (uint8)
+# time_step ضمني = ترتيب الفريم (0..n-1)
+QUANT_MAGIC = b'HSQ1'
+QUANT_VERSION = 1
+_QUANT_HEADER = struct.Struct('<4sBBBBII' + 'f' * len(VISEME_NUMERIC_KEYS))
+_QUANT_DTYPES = {8: np.dtype('<i1'), 16: np.dtype('<i2')}
+# أقصى قيمة مكممة → الفرق بين فريمين (delta) يبقى داخل مدى النوع
+_QUANT_MAX = {8: 63, 16: 16383}
+
+VISEME_TABLE_ID = zlib.crc32("\n".join(VISEME_CATEGORIES).encode('utf-8'))
+
+
+def encode_quantized_track(movements: list[dict], bits: int = 16) -> bytes:
+    """
+    animation_sequence → bytes
+    - scale لكل قناة = max|v| / qmax → خطأ إعادة البناء ≤ scale / 2
+    - delta بين الفريمات المتتالية (أول فريم قيمة مطلقة)
+    - الفئات كأرقام VISEME_CODES (uint8)
+    """
+    if bits not in _QUANT_DTYPES:
+        raise ValueError(f"bits لازم يكون 8 أو 16: {bits}")
+    qmax = _QUANT_MAX[bits]
+
+    values = np.array([[frame.get(key, 0.0) for key in VISEME_NUMERIC_KEYS] for frame in movements],
+                      dtype=np.float64).reshape(-1, len(VISEME_NUMERIC_KEYS))
+    codes = np.array([VISEME_CODES.get(frame.get('viseme_category', 'sil'), VISEME_CODES['sil'])
+                      for frame in movements], dtype=np.uint8)
+
+    peak = np.abs(values).max(axis=0) if len(values) else np.zeros(len(VISEME_NUMERIC_KEYS))
+    scales = np.where(peak > 0, peak / qmax, 1.0 / qmax).astype(np.float32)
+
+    quantized = np.clip(np.rint(values / scales), -qmax, qmax).astype(np.int32)
+    deltas = np.diff(quantized, axis=0, prepend=0).astype(_QUANT_DTYPES[bits])
+
+    header = _QUANT_HEADER.pack(QUANT_MAGIC, QUANT_VERSION, bits, len(VISEME_NUMERIC_KEYS), 0,
+                                len(movements), VISEME_TABLE_ID, *scales.tolist())
+    # القنوات column-major → كل قناة مصفوفة متصلة (أسهل للعميل)
+    return header + np.ascontiguousarray(deltas.T).tobytes() + codes.tobytes()
+
+
+def _parse_quantized_header(blob: bytes) -> tuple:
+    if len(blob) < _QUANT_HEADER.size:
+        raise ValueError(f"blob أقصر من الـ header ({len(blob)} < {_QUANT_HEADER.size} بايت)")
+    magic, version, bits, channels, _, n_frames, table_id, *scales = _QUANT_HEADER.unpack_from(blob)
+    if magic != QUANT_MAGIC or version != QUANT_VERSION:
+        raise ValueError("ليست صيغة quantized track معروفة")
+    if bits not in _QUANT_DTYPES or channels != len(VISEME_NUMERIC_KEYS):
+        raise ValueError(f"header غير مدعوم: bits={bits}, channels={channels}")
+    expected = _QUANT_HEADER.size + n_frames * (channels * _QUANT_DTYPES[bits].itemsize + 1)
+    if len(blob) < expected:
+        raise ValueError(f"blob ناقص: {len(blob)} بايت والمتوقع {expected} لـ {n_frames} فريم")
+    if table_id != VISEME_TABLE_ID:
+        logger.warning("جدول الفئات مختلف عن جدول المُرسل → أسماء الفئات قد لا تطابق")
+    return bits, n_frames, np.array(scales, dtype=np.float32)
+
+
+def decode_quantized_arrays(blob: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """bytes → (values float64 بشكل (n, 4) بترتيب VISEME_NUMERIC_KEYS، codes uint8)"""
+    bits, n_frames, scales = _parse_quantized_header(blob)
+    dtype = _QUANT_DTYPES[bits]
+    offset = _QUANT_HEADER.size
+    deltas = np.frombuffer(blob, dtype=dtype, count=n_frames * len(scales), offset=offset)
+    offset += deltas.nbytes
+    codes = np.frombuffer(blob, dtype=np.uint8, count=n_frames, offset=offset)
+
+    quantized = np.cumsum(deltas.reshape(len(scales), n_frames), axis=1, dtype=np.int32)
+    # float64 → الخطأ يبقى ضمن quantized_error_bound (تقريب float32 يزيد عليه)
+    return quantized.T * scales.astype(np.float64), codes
+
+
+def decode_quantized_track(blob: bytes) -> list[dict]:
+    """bytes → animation_sequence (القيم العددية + viseme_category فقط)"""
+    values, codes = decode_quantized_arrays(blob)
+    movements = []
+    for step, (row, code) in enumerate(zip(values.tolist(), codes.tolist())):
+        frame = {"time_step": step,
+                 "viseme_category": VISEME_CATEGORIES[code] if code < len(VISEME_CATEGORIES) else 'sil'}
+        frame.update(zip(VISEME_NUMERIC_KEYS, row))
+        movements.append(frame)
+    return movements
+
+
+def quantized_error_bound(blob: bytes) -> dict:
+    """أقصى خطأ مطلق متوقع لكل قناة بعد فك الترميز (نصف خطوة التكميم + تقريب float64 للضرب)"""
+    bits, _, scales = _parse_quantized_header(blob)
+    slack = _QUANT_MAX[bits] * np.finfo(np.float64).eps
+    return {key: float(scale) * (0.5 + slack) for key, scale in zip(VISEME_NUMERIC_KEYS, scales)}
+
 # ─── دالة رئيسية لمعالجة صوت حيواني ────────────────
-def process_animal_sound(animal_type: str, sound_description: str, output_file: str = None, ai_type: str = 'physical'):
+def process_animal_sound(
+    animal_type: str,
+    sound_description: str,
+    output_file: str = None,
+    ai_type: str = 'physical',
+    store: "ResultStore" = None
+):
     """معالجة وصف صوت حيواني"""
+    key = None
+    if store is not None:
+        key = animal_result_key(animal_type, sound_description, ai_type)
+        cached = store.get(key)
+        if cached is not None:
+            save_result_json(cached, output_file)
+            return cached
+
     mechanism = simulate_animal_sound(animal_type, sound_description)
     ai_features = apply_ai_features(mechanism, ai_type)
 
@@ -517,14 +1823,482 @@ def process_animal_sound(animal_type: str, sound_description: str, output_file:
         "ai_features": ai_features
     }
 
-    if output_file:
-        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        logger.info(f"تم حفظ النتيجة في: {output_file}")
+    if store is not None:
+        store.put(key, result)
+    save_result_json(result, output_file)
 
     return result
 
+# ─── قوالب توليد صوتي اصطناعي لكل آلية حيوانية ────────────────
+# كل مفتاح → (أقل قيمة، أعلى قيمة) يُسحب منها عشوائيًا لكل عينة
+# pulse_rate = 0 → صوت متصل بدون نبضات
+ANIMAL_SYNTH_PARAMS = ('f0', 'duration', 'fm_rate', 'fm_depth', 'pulse_rate', 'noise')
+
+ANIMAL_SYNTH_TEMPLATES = {
+    'birds':                {'f0': (2000, 6000), 'duration': (0.3, 1.2), 'fm_rate': (5, 30),   'fm_depth': (0.05, 0.30), 'pulse_rate': (0, 0),     'noise': (0.00, 0.05), 'harmonics': 2},
+    'whales_baleen':        {'f0': (30, 300),    'duration': (1.0, 3.0), 'fm_rate': (0.2, 2),  'fm_depth': (0.10, 0.50), 'pulse_rate': (0, 0),     'noise': (0.00, 0.10), 'harmonics': 4},
+    'whales_toothed':       {'f0': (5000, 9000), 'duration': (0.2, 1.0), 'fm_rate': (0, 0),    'fm_depth': (0.00, 0.00), 'pulse_rate': (10, 200),  'noise': (0.05, 0.20), 'harmonics': 1},
+    'bats':                 {'f0': (7000, 10000),'duration': (0.1, 0.5), 'fm_rate': (2, 10),   'fm_depth': (0.20, 0.40), 'pulse_rate': (10, 50),   'noise': (0.00, 0.05), 'harmonics': 1},
+    'primates':             {'f0': (150, 600),   'duration': (0.2, 1.0), 'fm_rate': (1, 8),    'fm_depth': (0.05, 0.30), 'pulse_rate': (0, 0),     'noise': (0.10, 0.40), 'harmonics': 6},
+    'insects_stridulation': {'f0': (3000, 5000), 'duration': (0.3, 1.5), 'fm_rate': (0, 0),    'fm_depth': (0.00, 0.00), 'pulse_rate': (20, 60),   'noise': (0.05, 0.15), 'harmonics': 2},
+    'insects_tymbals':      {'f0': (4000, 7000), 'duration': (0.5, 2.0), 'fm_rate': (0, 0),    'fm_depth': (0.00, 0.00), 'pulse_rate': (100, 400), 'noise': (0.10, 0.30), 'harmonics': 2},
+    'insects_drumming':     {'f0': (500, 1500),  'duration': (0.3, 1.5), 'fm_rate': (0, 0),    'fm_depth': (0.00, 0.00), 'pulse_rate': (5, 20),    'noise': (0.30, 0.60), 'harmonics': 1},
+    'amphibians':           {'f0': (100, 800),   'duration': (0.2, 1.0), 'fm_rate': (1, 5),    'fm_depth': (0.05, 0.20), 'pulse_rate': (10, 40),   'noise': (0.00, 0.10), 'harmonics': 5},
+    'fish':                 {'f0': (50, 250),    'duration': (0.2, 1.0), 'fm_rate': (0, 0),    'fm_depth': (0.00, 0.00), 'pulse_rate': (5, 30),    'noise': (0.05, 0.20), 'harmonics': 3},
+}
+
+# محسوبة مرة واحدة عند الاستيراد: مصفوفات الحدود + وصف الآلية (ثابت) لكل نوع
+_ANIMAL_TEMPLATES = {
+    animal_type: {
+        'low': np.array([tpl[k][0] for k in ANIMAL_SYNTH_PARAMS], dtype=np.float64),
+        'high': np.array([tpl[k][1] for k in ANIMAL_SYNTH_PARAMS], dtype=np.float64),
+        'harmonics': tpl['harmonics'],
+        'mechanism': simulate_animal_sound(animal_type, 'synthetic call'),
+    }
+    for animal_type, tpl in ANIMAL_SYNTH_TEMPLATES.items()
+}
+
+
+def animal_pitch_range(animal_type: str, sample_rate: int = 22050) -> tuple[float, float]:
+    """مدى الـ pitch لنوع الحيوان من حدود f0 في القالب (مع هامش الـ FM) - الحد الأعلى تحت nyquist"""
+    tpl = ANIMAL_SYNTH_TEMPLATES[animal_type]
+    f0_low, f0_high = tpl['f0']
+    depth = tpl['fm_depth'][1]
+    high = min(f0_high * (1.0 + depth), 0.95 * sample_rate / 2)
+    return float(f0_low * (1.0 - depth)), float(high)
+
+
+def sample_animal_params(animal_type: str, count: int, rng: np.random.Generator) -> np.ndarray:
+    """سحب count مجموعة معاملات عشوائية → مصفوفة (count, len(ANIMAL_SYNTH_PARAMS))"""
+    tpl = _ANIMAL_TEMPLATES[animal_type]
+    return tpl['low'] + (tpl['high'] - tpl['low']) * rng.random((count, len(ANIMAL_SYNTH_PARAMS)))
+
+
+def _synthesize_block(
+    animal_type: str,
+    params: np.ndarray,
+    width: int,
+    sample_rate: int,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """دفعة صغيرة من النداءات بعرض width (أطول نداء فيها) → float32 (len(params), width)"""
+    f0, duration, fm_rate, fm_depth, pulse_rate, noise = (params[:, [i]] for i in range(len(ANIMAL_SYNTH_PARAMS)))
+    samples = np.arange(width, dtype=np.float64)[None, :]
+    t = samples / sample_rate
+
+    # تردد لحظي مع FM ← الطور = تكامل التردد (float64 عشان دقة الطور على النداءات الطويلة)
+    nyquist = sample_rate / 2
+    freq = np.sin(2 * np.pi * fm_rate * t)
+    freq *= fm_depth
+    freq += 1.0
+    freq *= f0
+    np.minimum(freq, nyquist * 0.95, out=freq)
+    phase = np.cumsum(freq, axis=1)
+    phase *= 2 * np.pi / sample_rate
+
+    audio = np.zeros((len(params), width), dtype=np.float32)
+    for h in range(1, _ANIMAL_TEMPLATES[animal_type]['harmonics'] + 1):
+        harmonic = np.sin(h * phase)
+        # أي توافقي فوق nyquist يُهمل بدل ما يعمل aliasing
+        harmonic[freq * h >= nyquist] = 0.0
+        harmonic /= h
+        audio += harmonic
+    del freq, phase
+
+    # نبضات (clicks / chirps) ← gating بموجة مربعة ناعمة
+    pulsed = pulse_rate[:, 0] > 0
+    if pulsed.any():
+        gate = np.sin(2 * np.pi * pulse_rate[pulsed] * t)
+        gate *= 8.0
+        np.tanh(gate, out=gate)
+        gate += 1.0
+        gate *= 0.5
+        audio[pulsed] *= gate
+        del gate
+
+    grain = rng.standard_normal(audio.shape, dtype=np.float32)
+    grain *= noise.astype(np.float32)
+    audio += grain
+    del grain
+
+    # attack/release قصير لتفادي طقطقة البداية والنهاية (وصفر بعد نهاية كل نداء)
+    ramp = 0.01 * sample_rate
+    length = np.maximum(1, np.floor(duration * sample_rate))
+    envelope = np.minimum(samples, length - samples)
+    envelope /= ramp
+    np.clip(envelope, 0.0, 1.0, out=envelope)
+    audio *= envelope
+    del envelope
+
+    peak = np.abs(audio).max(axis=1, keepdims=True)
+    audio /= np.where(peak > 0, peak, 1.0)
+    return audio
+
+
+def animal_call_lengths(params: np.ndarray, sample_rate: int) -> np.ndarray:
+    """طول كل نداء بالعينات (نفس floor(duration * sr) في الـ envelope)"""
+    return np.maximum(1, (np.atleast_2d(params)[:, 1] * sample_rate).astype(np.int32))
+
+
+def iter_animal_call_blocks(
+    animal_type: str,
+    params: np.ndarray,
+    sample_rate: int = 22050,
+    rng: np.random.Generator = None,
+    block_samples: int = 1 << 19
+):
+    """
+    مولّد دفعات: (فهارس النداءات، audio float32 بشكل (len(idx), width))
+    - النداءات مرتبة حسب الطول ومقسمة على دفعات بحدود block_samples عينة،
+      كل دفعة بعرض أطول نداء فيها → الذاكرة المؤقتة ثابتة مهما كبر عدد النداءات
+    - بعد طول كل نداء (animal_call_lengths) العينات أصفار
+    """
+    rng = rng or np.random.default_rng()
+    params = np.atleast_2d(params)
+    lengths = animal_call_lengths(params, sample_rate)
+
+    order = np.argsort(lengths, kind='stable')
+    lo = 0
+    while lo < len(order):
+        # ترتيب تصاعدي → آخر نداء في الدفعة هو الأطول ويحدد عرضها
+        hi = lo + 1
+        while hi < len(order) and (hi + 1 - lo) * int(lengths[order[hi]]) <= block_samples:
+            hi += 1
+        idx = order[lo:hi]
+        width = int(lengths[idx[-1]])
+        yield idx, _synthesize_block(animal_type, params[idx], width, sample_rate, rng)
+        lo = hi
+
+
+def synthesize_animal_calls(
+    animal_type: str,
+    params: np.ndarray,
+    sample_rate: int = 22050,
+    rng: np.random.Generator = None,
+    block_samples: int = 1 << 19
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    توليد صوتي متجه (vectorized) لعدة نداءات من نفس النوع
+    - params: مصفوفة من sample_animal_params
+    - يرجع (audio float32 بشكل (count, max_len) مع zero padding، lengths int32)
+    - للتخزين استخدم synthesize_animal_pcm (بدون padding)
+    """
+    params = np.atleast_2d(params)
+    lengths = animal_call_lengths(params, sample_rate)
+    audio = np.zeros((len(params), int(lengths.max())), dtype=np.float32)
+    for idx, block in iter_animal_call_blocks(animal_type, params, sample_rate, rng, block_samples):
+        audio[idx, :block.shape[1]] = block
+    return audio, lengths
+
+
+# PCM 16-bit: العينة = rint(x * ANIMAL_PCM_SCALE) → الخطأ ≤ 0.5 / ANIMAL_PCM_SCALE
+ANIMAL_PCM_SCALE = 32767
+
+
+def synthesize_animal_pcm(
+    animal_type: str,
+    params: np.ndarray,
+    sample_rate: int = 22050,
+    rng: np.random.Generator = None,
+    block_samples: int = 1 << 19
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    نفس synthesize_animal_calls لكن ragged → (pcm int16 متصل، offsets int64 بطول count + 1)
+    - النداء i = pcm[offsets[i]:offsets[i + 1]] (بدون padding)
+    """
+    params = np.atleast_2d(params)
+    lengths = animal_call_lengths(params, sample_rate)
+    offsets = np.zeros(len(params) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    pcm = np.empty(int(offsets[-1]), dtype=np.int16)
+    for idx, block in iter_animal_call_blocks(animal_type, params, sample_rate, rng, block_samples):
+        block *= ANIMAL_PCM_SCALE
+        np.rint(block, out=block)
+        for row, call in enumerate(idx.tolist()):
+            pcm[offsets[call]:offsets[call + 1]] = block[row, :lengths[call]]
+    return pcm, offsets
+
+
+def load_animal_shard(path: str) -> dict:
+    """
+    قراءة shard من generate_animal_corpus
+    - calls: قائمة float32 لكل نداء بطوله الحقيقي (views على مصفوفة واحدة)
+    - params، lengths، sample_index كما هي
+    """
+    with np.load(path) as data:
+        shard = {key: data[key] for key in data.files}
+    audio = shard.pop('audio').astype(np.float32)
+    audio *= 1.0 / ANIMAL_PCM_SCALE
+    shard['calls'] = np.split(audio, shard['offsets'][1:-1])
+    return shard
+
+
+def _generate_animal_shard(task: dict) -> dict:
+    """عامل (worker) لإنتاج shard واحد - لازم يكون top-level عشان ProcessPoolExecutor"""
+    animal_type = task['animal_type']
+    rng = np.random.default_rng(np.random.SeedSequence(task['seed_entropy']))
+
+    params = sample_animal_params(animal_type, task['count'], rng)
+    pcm, offsets = synthesize_animal_pcm(animal_type, params, task['sample_rate'], rng)
+
+    # الضوضاء في int16 ما تنضغط تقريبًا → zlib اختياري (أبطأ بكثير وتوفيره قليل)
+    save = np.savez_compressed if task.get('compress') else np.savez
+    save(
+        task['path'],
+        audio=pcm,
+        offsets=offsets,
+        lengths=np.diff(offsets).astype(np.int32),
+        params=params.astype(np.float32),
+        sample_index=np.arange(task['start_index'], task['start_index'] + task['count'], dtype=np.int64),
+    )
+    return {
+        "file": Path(task['path']).name,
+        "animal_type": animal_type,
+        "start_index": task['start_index'],
+        "count": task['count'],
+        "samples": int(offsets[-1]),
+    }
+
+
+def generate_animal_corpus(
+    output_dir: str,
+    variations_per_type: int = 100,
+    seed: int = 0,
+    sample_rate: int = 22050,
+    shard_size: int = 256,
+    workers: int = None,
+    animal_types: list[str] = None,
+    compress: bool = False
+) -> dict:
+    """
+    توليد مجموعة بيانات اصطناعية كبيرة من نداءات الحيوانات
+    - variations_per_type عينة لكل نوع آلية بمعاملات وبذور عشوائية
+    - كل shard = نوع واحد، يُولّد دفعة واحدة داخل عامل في ProcessPoolExecutor
+    - الإخراج: ملفات shard_*.npz (PCM int16 ragged: audio + offsets، اقرأها بـ load_animal_shard)
+      + manifest.json (فيه وصف الآليات مرة واحدة)
+    - البذرة لكل shard مشتقة من (seed, crc32 لاسم النوع, رقم shard)
+      → نفس النتيجة بغض النظر عن عدد العمال أو ترتيب/اختيار animal_types
+    """
+    animal_types = animal_types or list(ANIMAL_SYNTH_TEMPLATES)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = []
+    for animal_type in animal_types:
+        if animal_type not in _ANIMAL_TEMPLATES:
+            raise ValueError(f"نوع الحيوان غير معروف: {animal_type}")
+        type_key = zlib.crc32(animal_type.encode('utf-8'))
+        for shard_idx, start in enumerate(range(0, variations_per_type, shard_size)):
+            tasks.append({
+                'animal_type': animal_type,
+                'start_index': start,
+                'count': min(shard_size, variations_per_type - start),
+                'sample_rate': sample_rate,
+                'seed_entropy': [seed, type_key, shard_idx],
+                'path': str(output_dir / f"shard_{animal_type}_{shard_idx:05d}.npz"),
+                'compress': compress,
+            })
+
+    if workers == 1:
+        shards = [_generate_animal_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            shards = list(pool.map(_generate_animal_shard, tasks))
+
+    manifest = {
+        "version": 2,
+        "seed": seed,
+        "sample_rate": sample_rate,
+        "audio_format": {"dtype": "int16", "scale": ANIMAL_PCM_SCALE, "layout": "ragged", "compressed": compress},
+        "variations_per_type": variations_per_type,
+        "param_names": list(ANIMAL_SYNTH_PARAMS),
+        "mechanisms": {t: _ANIMAL_TEMPLATES[t]['mechanism'] for t in animal_types},
+        "templates": {t: ANIMAL_SYNTH_TEMPLATES[t] for t in animal_types},
+        "total_samples": sum(s['count'] for s in shards),
+        "shards": shards,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(output_dir / "manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    logger.info(f"تم توليد {manifest['total_samples']} عينة في {len(shards)} shard داخل: {output_dir}")
+
+    return manifest
+
+# ─── مخزن نتائج content-addressed (تخطي العمل المنجز + استكمال بعد الانهيار) ────────────────
+def _tables_version() -> str:
+    """hash لكل الجداول اللي تأثر على النتيجة → أي تعديل عليها يبطل الكاش تلقائيًا"""
+    tables = {
+        "viseme_animation_human": VISeme_ANIMATION_HUMAN,
+        "phoneme_to_viseme": PHONEME_TO_VISEME,
+        "viseme_details": VISEME_DETAILS,
+        "emotion_multipliers": EMOTION_MULTIPLIERS,
+        "simple_fallback": SIMPLE_FALLBACK,
+        "animal_sound_mechanisms": ANIMAL_SOUND_MECHANISMS,
+        "animal_synth_templates": ANIMAL_SYNTH_TEMPLATES,
+        "animal_synth_params": ANIMAL_SYNTH_PARAMS,
+        # الإيماءات
+        "frame_duration": FRAME_DURATION_SEC,
+        "viseme_to_animation_key": VISEME_TO_ANIMATION_KEY,
+        "arpabet_to_animation_key": ARPABET_TO_ANIMATION_KEY,
+        "stress_beat_gesture": STRESS_BEAT_GESTURE,
+        "gesture_table": GESTURE_TABLE,
+        # الكلمات خارج القاموس + أي محرك استُخدم لها
+        "letter_to_sound_rules": LETTER_TO_SOUND_RULES,
+        "oov_engine": "g2p_en" if g2p is not None else "letter_to_sound",
+        # prosody
+        "sentence_end": SENTENCE_END.pattern,
+        "clause_end": CLAUSE_END.pattern,
+        "token_punct": TOKEN_PUNCT,
+        "sentence_pause_frames": SENTENCE_PAUSE_FRAMES,
+        "clause_pause_frames": CLAUSE_PAUSE_FRAMES,
+        "stress_hold_frames": STRESS_HOLD_FRAMES,
+        "content_tag_prefixes": CONTENT_TAG_PREFIXES,
+        "function_words": sorted(FUNCTION_WORDS),
+    }
+    blob = json.dumps(tables, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+TABLES_VERSION = _tables_version()
+
+
+def result_key(kind: str, **fields) -> str:
+    blob = json.dumps({"kind": kind, "tables": TABLES_VERSION, **fields}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def human_result_key(
+    text: str,
+    language: str,
+    emotion: str,
+    ai_type: str,
+    prosody: bool = False,
+    prosody_plan: list[dict] = None,
+    audio: np.ndarray = None,
+    sample_rate: int = 16000
+) -> str:
+    fields = dict(text=text, language=language, emotion=emotion, ai_type=ai_type, prosody=bool(prosody or prosody_plan))
+    if prosody_plan:
+        # خطة من المستدعي (pause/hold/stress) جزء من المدخلات → تدخل في المفتاح كما هي
+        fields["prosody_plan"] = prosody_plan
+    elif prosody:
+        # الخطة المحسوبة داخليًا تختلف حسب توفر الـ POS tagger
+        fields["pos_tagger"] = get_pos_tagger() is not None
+    if audio is not None:
+        # التسجيل نفسه مدخل → hash للعينات بدل تخزينها في المفتاح
+        samples = np.ascontiguousarray(audio, dtype=np.float32)
+        fields["audio"] = hashlib.sha256(samples.tobytes()).hexdigest()
+        fields["sample_rate"] = sample_rate
+    return result_key("human", **fields)
+
+
+def animal_result_key(animal_type: str, sound_description: str, ai_type: str) -> str:
+    return result_key("animal", animal_type=animal_type, sound_description=sound_description, ai_type=ai_type)
+
+
+class ResultStore:
+    """
+    مخزن نتائج JSON بمفتاح = sha256 للمدخلات
+    - الملفات في root/objects/ab/cd/<key>.json (مجلدات مقسمة → ما في مجلد فيه ملايين الملفات)
+    - الكتابة ذرية: ملف مؤقت في نفس المجلد ثم os.replace
+    - index.bin: digest خام (32 بايت) لكل نتيجة، يُحمّل مرة واحدة في set للفحص السريع
+    """
+
+    DIGEST_BYTES = 32
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.bin"
+        self._keys = set()
+        self._load_index()
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        raw = self.index_path.read_bytes()
+        usable = len(raw) - len(raw) % self.DIGEST_BYTES
+        if usable != len(raw):
+            # سجل ناقص من انهيار أثناء الإلحاق → نتجاهله
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(usable)
+        self._keys = {raw[i:i + self.DIGEST_BYTES] for i in range(0, usable, self.DIGEST_BYTES)}
+
+    def path(self, key: str) -> Path:
+        return self.objects / key[:2] / key[2:4] / f"{key}.json"
+
+    def has(self, key: str) -> bool:
+        return bytes.fromhex(key) in self._keys
+
+    def __contains__(self, key: str) -> bool:
+        return self.has(key)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, key: str) -> dict | None:
+        if not self.has(key):
+            return None
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"نتيجة تالفة/مفقودة في المخزن {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, result: dict) -> Path:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        digest = bytes.fromhex(key)
+        if digest not in self._keys:
+            # الإلحاق بعد ما الملف صار نهائي → الـ index ما يشير لملف ناقص أبدًا
+            with open(self.index_path, 'ab') as f:
+                f.write(digest)
+            self._keys.add(digest)
+        return path
+
+    def rebuild_index(self) -> int:
+        """إعادة بناء الـ index من الملفات (لو انقطع التشغيل بين os.replace والإلحاق)"""
+        keys = {bytes.fromhex(p.stem) for p in self.objects.glob("*/*/*.json")}
+        tmp_index = self.index_path.with_suffix(".tmp")
+        tmp_index.write_bytes(b"".join(sorted(keys)))
+        os.replace(tmp_index, self.index_path)
+        self._keys = keys
+        return len(keys)
+
+
+def process_human_batch(items: list[dict], store: ResultStore, ai_type: str = 'physical') -> list[tuple[str, bool]]:
+    """
+    معالجة عدة نصوص مع تخطي أي نتيجة موجودة في المخزن
+    - items: [{"text": ..., "language": ..., "emotion": ...}]
+    - يرجع [(key, كان_موجود_مسبقًا)] - النتيجة نفسها في store.path(key)
+    """
+    done = []
+    for item in items:
+        language = item.get("language", 'eng')
+        emotion = item.get("emotion", 'neutral')
+        key = human_result_key(item["text"], language, emotion, ai_type)
+        cached = store.has(key)
+        if not cached:
+            process_human_text(item["text"], language, ai_type=ai_type, emotion=emotion, store=store)
+        done.append((key, cached))
+    return done
+
 # ─── الدالة الرئيسية للتشغيل ────────────────
 def main():
     # أمثلة بشرية
@@ -0,0 +1,281 @@
+# speech_frame_ring.py
+"""
+نقل الفريمات بين عمليات التوليد (human_speech.py) وعمليات العرض (speech_visualizer.py)
+بدون JSON وبدون قرص:
+- ring buffer داخل multiprocessing.shared_memory
+- كل فريم = سجل float32 بطول ثابت (FRAME_FIELDS)
+- header صغير (int64) فيه العدادات + مؤشر قراءة لكل renderer
+- منطقة metadata (JSON) يكتبها المنشئ مرة واحدة (جدول الفئات مثلًا)
+
+الكاتب ما يتجاوز أبطأ قارئ مسجل → الذاكرة محدودة بـ capacity
+وبدون أي قارئ مسجل الكاتب ينتظر (القارئ يبدأ من الفريمات الجاية → أي كتابة قبله تضيع)،
+إلا إذا كل القراء غادروا بعد ما تسجلوا → الكتابة ترفع BrokenPipeError بدل انتظار للأبد
+"""
+
+import json
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+FRAME_FIELDS = ('time_step', 'mouth_open', 'jaw_open', 'lip_round', 'lip_spread',
+                'viseme_code', 'stream_id', 'reserved')
+RECORD_FLOATS = len(FRAME_FIELDS)
+
+MAX_READERS = 8
+METADATA_BYTES = 16384
+_MAGIC = 0x48534652  # 'HSFR'
+
+# مواقع الحقول داخل الـ header
+_H_MAGIC, _H_CAPACITY, _H_RECORD, _H_WRITE, _H_CLOSED, _H_META_LEN, _H_ABANDONED = range(7)
+_H_READERS = 8
+_HEADER_SLOTS = _H_READERS + MAX_READERS
+_HEADER_BYTES = _HEADER_SLOTS * 8
+
+_POLL_SEC = 0.0005
+
+
+class SharedFrameRing:
+    """
+    ring buffer مشترك بين العمليات
+    - create() في العملية المالكة، attach(name) في الباقي
+    - أكثر من كاتب → مرر نفس multiprocessing.Lock (lock) لكل الكتّاب (مثلًا عبر initializer)
+    - أكثر من قارئ → مرر reader_lock ثاني مشترك بينهم → تسجيل القراء ذري
+      (منفصل عن lock لأن الكاتب يمسك lock وهو ينتظر مساحة/قراء)
+    - كل renderer يسجل نفسه بـ register_reader() ويقرأ كل الفريمات (broadcast)
+    - العملية المالكة فقط تعمل unlink للذاكرة
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool, lock=None, reader_lock=None):
+        self.shm = shm
+        self.owner = owner
+        self.lock = lock
+        self.reader_lock = reader_lock
+        self.header = np.ndarray((_HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[_H_MAGIC] != _MAGIC:
+            raise ValueError(f"الذاكرة المشتركة ليست frame ring: {shm.name}")
+        self.capacity = int(self.header[_H_CAPACITY])
+        self.data = np.ndarray(
+            (self.capacity, RECORD_FLOATS), dtype=np.float32,
+            buffer=shm.buf, offset=_HEADER_BYTES + METADATA_BYTES
+        )
+
+    @classmethod
+    def create(cls, capacity: int = 4096, name: str = None, metadata: dict = None, lock=None) -> "SharedFrameRing":
+        size = _HEADER_BYTES + METADATA_BYTES + capacity * RECORD_FLOATS * 4
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((_HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_H_READERS:] = -1
+        header[_H_CAPACITY] = capacity
+        header[_H_RECORD] = RECORD_FLOATS
+
+        blob = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+        if len(blob) > METADATA_BYTES:
+            shm.close()
+            shm.unlink()
+            raise ValueError(f"metadata أكبر من {METADATA_BYTES} بايت")
+        shm.buf[_HEADER_BYTES:_HEADER_BYTES + len(blob)] = blob
+        header[_H_META_LEN] = len(blob)
+        header[_H_MAGIC] = _MAGIC
+        return cls(shm, owner=True, lock=lock)
+
+    @classmethod
+    def attach(cls, name: str, lock=None, reader_lock=None) -> "SharedFrameRing":
+        try:
+            # Python 3.13+: العملية اللي تعمل attach ما تسجل الذاكرة في resource_tracker
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # قبل 3.13: الـ attach يسجلها → الـ tracker يعمل unlink لما تنتهي العملية
+            # ويختفي الـ ring من المالك وباقي العمليات
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False, lock=lock, reader_lock=reader_lock)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def metadata(self) -> dict:
+        length = int(self.header[_H_META_LEN])
+        return json.loads(bytes(self.shm.buf[_HEADER_BYTES:_HEADER_BYTES + length]).decode('utf-8'))
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.header[_H_CLOSED])
+
+    @property
+    def abandoned(self) -> bool:
+        """كان فيه قارئ مسجل وكل القراء غادروا → ما أحد بيقرأ الفريمات الجاية"""
+        return bool(self.header[_H_ABANDONED])
+
+    @staticmethod
+    def _with(lock, func, *args):
+        if lock is None:
+            return func(*args)
+        with lock:
+            return func(*args)
+
+    # ─── القراء ────────────────────────────────────────────────────────
+    def _register(self) -> int:
+        for slot in range(MAX_READERS):
+            if self.header[_H_READERS + slot] < 0:
+                # القارئ الجديد يبدأ من الفريمات الجاية (ما يرجع للقديم)
+                self.header[_H_READERS + slot] = self.header[_H_WRITE]
+                self.header[_H_ABANDONED] = 0
+                return slot
+        raise RuntimeError(f"وصلنا للحد الأقصى من القراء ({MAX_READERS})")
+
+    def register_reader(self) -> int:
+        return self._with(self.reader_lock, self._register)
+
+    def wait_for_readers(self, count: int = 1, timeout: float = None) -> bool:
+        """الكاتب ينتظر تسجيل count قارئ قبل ما يبدأ (القارئ يبدأ من الفريمات الجاية فقط)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while int((self.header[_H_READERS:] >= 0).sum()) < count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(_POLL_SEC)
+        return True
+
+    def _unregister(self, reader_id: int):
+        self.header[_H_READERS + reader_id] = -1
+        if not (self.header[_H_READERS:] >= 0).any():
+            self.header[_H_ABANDONED] = 1
+
+    def unregister_reader(self, reader_id: int):
+        self._with(self.reader_lock, self._unregister, reader_id)
+
+    def read(self, reader_id: int, max_records: int = None, timeout: float = None) -> np.ndarray:
+        """
+        قراءة الفريمات المتاحة (نسخة) → مصفوفة (n, RECORD_FLOATS)
+        - تنتظر لحد ما يوصل فريم واحد على الأقل أو ينتهي timeout
+        - مصفوفة فاضية + closed=True → الكاتب خلص وما في شيء متبقي
+        """
+        slot = _H_READERS + reader_id
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # closed يُقرأ قبل العداد → أي فريم نُشر قبل الإغلاق يظهر هنا
+            closed = self.closed
+            read_seq = int(self.header[slot])
+            available = int(self.header[_H_WRITE]) - read_seq
+            if available > 0 or closed:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(_POLL_SEC)
+
+        count = available if max_records is None else min(available, max_records)
+        if count <= 0:
+            return np.empty((0, RECORD_FLOATS), dtype=np.float32)
+
+        start = read_seq % self.capacity
+        first = min(count, self.capacity - start)
+        out = np.empty((count, RECORD_FLOATS), dtype=np.float32)
+        out[:first] = self.data[start:start + first]
+        out[first:] = self.data[:count - first]
+        self.header[slot] = read_seq + count
+        return out
+
+    # ─── الكتّاب ───────────────────────────────────────────────────────
+    def _free_space(self, write_seq: int) -> int:
+        readers = self.header[_H_READERS:]
+        active = readers[readers >= 0]
+        if not len(active):
+            # ما في قارئ → أي فريم يُكتب الآن ما أحد يشوفه
+            return 0
+        return self.capacity - (write_seq - int(active.min()))
+
+    def _write(self, records: np.ndarray, timeout: float):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = 0
+        while done < len(records):
+            write_seq = int(self.header[_H_WRITE])
+            free = self._free_space(write_seq)
+            if free <= 0:
+                if self.abandoned:
+                    raise BrokenPipeError("كل القراء غادروا الـ ring")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("الـ ring ممتلئ والقارئ لم يتقدم")
+                time.sleep(_POLL_SEC)
+                continue
+
+            count = min(free, len(records) - done)
+            start = write_seq % self.capacity
+            first = min(count, self.capacity - start)
+            self.data[start:start + first] = records[done:done + first]
+            self.data[:count - first] = records[done + first:done + count]
+            # النشر بعد نسخ البيانات → القارئ ما يشوف سجل نصه مكتوب
+            self.header[_H_WRITE] = write_seq + count
+            done += count
+
+    def write(self, records: np.ndarray, timeout: float = None):
+        """
+        كتابة سجلات (n, RECORD_FLOATS) - تنتظر إذا الـ ring ممتلئ أو ما في قارئ مسجل (backpressure)
+        - timeout → TimeoutError، وكل القراء غادروا → BrokenPipeError
+        """
+        records = np.asarray(records, dtype=np.float32).reshape(-1, RECORD_FLOATS)
+        self._with(self.lock, self._write, records, timeout)
+
+    def close_writer(self):
+        """إعلام القراء إنه ما في فريمات جديدة (بدونه read/iter_ring_frames تنتظر للأبد)"""
+        self.header[_H_CLOSED] = 1
+
+    def close(self):
+        # لازم نحرر الـ views قبل إغلاق الـ buffer
+        del self.header, self.data
+        self.shm.close()
+        if self.owner:
+            # قبل 3.13 عملية attach تشارك tracker المالك ممكن تكون شالت التسجيل
+            # → نعيده (register ذري ومكرر بأمان) عشان unlink ما يطبع KeyError في الـ tracker
+            resource_tracker.register(self.shm._name, "shared_memory")
+            self.shm.unlink()
+
+
+def iter_ring_frames(name: str, batch: int = 256, timeout: float = 0.1, reader_lock=None):
+    """
+    مولّد للـ renderer: يرجع دفعات فريمات لحد ما يغلق الكاتب الـ ring
+    - reader_lock: multiprocessing.Lock مشترك بين القراء (تسجيل ذري لو فيه أكثر من renderer)
+    """
+    ring = SharedFrameRing.attach(name, reader_lock=reader_lock)
+    reader_id = ring.register_reader()
+    try:
+        while True:
+            records = ring.read(reader_id, max_records=batch, timeout=timeout)
+            if len(records):
+                yield records
+            elif ring.closed:
+                break
+    finally:
+        ring.unregister_reader(reader_id)
+        ring.close()
+
+
+def records_to_movements(records: np.ndarray, metadata: dict) -> list[dict]:
+    """
+    تحويل سجلات الـ ring → dicts بنفس شكل animation_sequence
+    metadata = {"categories": [...], "details": {category: {lips, jaw, tongue, face}}}
+    """
+    categories = metadata.get("categories", [])
+    details = metadata.get("details", {})
+    movements = []
+    for row in records:
+        code = int(row[5])
+        category = categories[code] if 0 <= code < len(categories) else 'sil'
+        desc = details.get(category, {})
+        movements.append({
+            "time_step": int(row[0]),
+            "viseme_category": category,
+            "mouth_open": float(row[1]),
+            "jaw_open": float(row[2]),
+            "lip_round": float(row[3]),
+            "lip_spread": float(row[4]),
+            "lips": desc.get('lips', 'relaxed'),
+            "jaw": desc.get('jaw', 'closed'),
+            "tongue": desc.get('tongue', 'rest'),
+            "face_expression": desc.get('face', 'neutral'),
+            "stream_id": int(row[6]),
+        })
+    return movements
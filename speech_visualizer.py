@@ -4,6 +4,9 @@ import json
 from pathlib import Path
 import logging
 import time
+from collections import deque
+
+from speech_frame_ring import SharedFrameRing, records_to_movements
 
 try:
     from gtts import gTTS
@@ -83,24 +86,100 @@ def interpolate(from_mov: dict, to_mov: dict, t: float = 0.6) -> dict:
 
     return result
     
-# ─── Visualization بسيطة للفم والوجه ────────────────────────
-def visualize_speech_movements(movements: list[dict], duration_per_step=0.12):
-    """
-    رسم متحرك بسيط لمحاكاة حركات النطق
-    - repeat=False → يشتغل مرة وحدة ويتوقف (أفضل للتزامن مع الصوت)
-    - blit=True → تحديث أسرع للعناصر المتغيرة فقط
-    """
-
-    if not movements:
-        print("لا توجد حركات لعرضها")
-        return
+# ─── هندسة الفريم (مشتركة بين العرض العادي والعرض المتزامن مع الصوت) ────────────────
+# خريطة مواقع اللسان (أكثر مرونة)
+TONGUE_Y_MAP = {
+    'high': 6.5, 'high front': 6.8, 'high back': 6.2,
+    'mid': 5.0,
+    'low': 2.5, 'low back': 2.8,
+    'between_teeth': 3.8, 'near_teeth': 4.0,
+    'retroflex': 5.2, 'bunched': 5.0,
+    'rest': 4.5
+}
 
+FACE_COLORS = ['lightgray', 'lightblue', 'lightcoral', 'yellow']
+
+# أعمدة مصفوفة الهندسة المحسوبة مسبقًا
+GEOMETRY_FIELDS = ('jaw_height', 'jaw_y', 'lip_radius', 'tongue_y', 'face_color')
+
+
+def blend_movements(prev_mov: dict, current: dict, t: float = 0.68) -> dict:
+    """blending بين الحركة السابقة والحالية (القيم العددية) + الوصف النصي من الحالية"""
+    blended = {}
+    for key in ['mouth_open', 'jaw_open', 'lip_round', 'lip_spread']:
+        v1 = prev_mov.get(key, 0.0)
+        v2 = current.get(key, 0.0)
+        blended[key] = v1 + (v2 - v1) * t
+
+    blended['lips']   = current.get('lips',   prev_mov.get('lips',   'relaxed_neutral'))
+    blended['tongue'] = current.get('tongue', prev_mov.get('tongue', 'rest'))
+    blended['jaw']    = current.get('jaw',    prev_mov.get('jaw',    'closed'))
+    blended['face_expression'] = current.get('face_expression', prev_mov.get('face_expression', 'neutral'))
+    return blended
+
+
+def frame_geometry(blended: dict) -> tuple[float, float, float, float, int]:
+    """حركة (بعد blending) → (jaw_height, jaw_y, lip_radius, tongue_y, face_color index)"""
+    # ─── الفك ───────────────────────────────────────────────────────────
+    jaw_height = 2.0
+    jaw_desc = blended['jaw'].lower()
+    if any(x in jaw_desc for x in ['wide', 'open wide']):
+        jaw_height = 5.0
+    elif any(x in jaw_desc for x in ['medium', 'medium open']):
+        jaw_height = 3.5
+    elif 'slightly open' in jaw_desc:
+        jaw_height = 2.8
+
+    # ─── الشفاه ────────────────────────────────────────────────────────
+    lips_desc = blended['lips'].lower()
+    lip_radius = 2.8
+
+    if 'closed' in lips_desc:
+        lip_radius = 2.5
+    elif any(x in lips_desc for x in ['rounded', 'forward', 'pursed', 'protruded']):
+        lip_radius = 1.8 + blended.get('lip_round', 0.0) * 0.6
+    elif 'spread' in lips_desc or 'wide' in lips_desc:
+        lip_radius = 3.2 + blended.get('lip_spread', 0.0) * 0.4
+
+    # ─── اللسان ────────────────────────────────────────────────────────
+    tongue_y = 4.5
+    tongue_desc = blended['tongue'].lower()
+    for key, pos in TONGUE_Y_MAP.items():
+        if key in tongue_desc:
+            tongue_y = pos
+            break
+
+    # ─── لون الوجه (تعبير بسيط) ───────────────────────────────────────
+    face_expr = blended['face_expression'].lower()
+    face_color = 0
+    if any(x in face_expr for x in ['smile', 'happy']):
+        face_color = 1
+    elif any(x in face_expr for x in ['angry', 'tense']):
+        face_color = 2
+    elif any(x in face_expr for x in ['surprised', 'excited']):
+        face_color = 3
+
+    # مركزي أكثر
+    return jaw_height, 3 - jaw_height / 2, lip_radius, tongue_y, face_color
+
+
+def precompute_geometry(movements: list[dict]) -> np.ndarray:
+    """كل الفريمات مرة واحدة → مصفوفة float32 بشكل (n, len(GEOMETRY_FIELDS))"""
+    geometry = np.empty((len(movements), len(GEOMETRY_FIELDS)), dtype=np.float32)
+    prev_mov = movements[0] if movements else {}
+    for idx, current in enumerate(movements):
+        geometry[idx] = frame_geometry(blend_movements(prev_mov, current))
+        prev_mov = current
+    return geometry
+
+
+def create_mouth_figure(title: str = "محاكاة حركات النطق (بسيطة)"):
     fig, ax = plt.subplots(figsize=(6, 6))
     ax.set_xlim(0, 10)
     ax.set_ylim(0, 10)
     ax.set_aspect('equal')
     ax.axis('off')
-    ax.set_title("محاكاة حركات النطق (بسيطة)")
+    ax.set_title(title)
 
     # ─── العناصر الرسومية ────────────────────────────────────────────────
     jaw = Rectangle((2, 1), 6, 2, fc='lightgray', ec='black', lw=1.5)
@@ -112,20 +191,37 @@ def visualize_speech_movements(movements: list[dict], duration_per_step=0.12):
     ax.add_patch(upper_lip)
     ax.add_patch(lower_lip)
     ax.add_patch(tongue_tip)
+    return fig, (jaw, upper_lip, lower_lip, tongue_tip)
+
+
+def apply_geometry(patches: tuple, row) -> tuple:
+    jaw, upper_lip, lower_lip, tongue_tip = patches
+    jaw_height, jaw_y, lip_radius, tongue_y, face_color = row
+    jaw.set_height(jaw_height)
+    jaw.set_y(jaw_y)
+    lower_lip.set_radius(lip_radius)
+    upper_lip.set_radius(lip_radius)
+    tongue_tip.center = (5, tongue_y)
+    jaw.set_facecolor(FACE_COLORS[int(face_color)])
+    return patches
+
+# ─── Visualization بسيطة للفم والوجه ────────────────────────
+def visualize_speech_movements(movements: list[dict], duration_per_step=0.12):
+    """
+    رسم متحرك بسيط لمحاكاة حركات النطق
+    - repeat=False → يشتغل مرة وحدة ويتوقف (أفضل للتزامن مع الصوت)
+    - blit=True → تحديث أسرع للعناصر المتغيرة فقط
+    """
+
+    if not movements:
+        print("لا توجد حركات لعرضها")
+        return
+
+    fig, patches = create_mouth_figure()
 
     # نعمل نسخة من أول حركة عشان ما نعدلش القائمة الأصلية
     prev_mov = movements[0].copy()
 
-    # خريطة مواقع اللسان (أكثر مرونة)
-    tongue_y_map = {
-        'high': 6.5, 'high front': 6.8, 'high back': 6.2,
-        'mid': 5.0,
-        'low': 2.5, 'low back': 2.8,
-        'between_teeth': 3.8, 'near_teeth': 4.0,
-        'retroflex': 5.2, 'bunched': 5.0,
-        'rest': 4.5
-    }
-
     def update(frame):
         nonlocal prev_mov
 
@@ -133,71 +229,11 @@ def visualize_speech_movements(movements: list[dict], duration_per_step=0.12):
         current = movements[frame % len(movements)]
 
         # blending factor (يمكنك تجربة قيم مختلفة: 0.6 → 0.75)
-        t = 0.68
-
-        blended = {}
-        for key in ['mouth_open', 'jaw_open', 'lip_round', 'lip_spread']:
-            v1 = prev_mov.get(key, 0.0)
-            v2 = current.get(key, 0.0)
-            blended[key] = v1 + (v2 - v1) * t
-
-        blended['lips']   = current.get('lips',   prev_mov.get('lips',   'relaxed_neutral'))
-        blended['tongue'] = current.get('tongue', prev_mov.get('tongue', 'rest'))
-        blended['jaw']    = current.get('jaw',    prev_mov.get('jaw',    'closed'))
-        blended['face_expression'] = current.get('face_expression', prev_mov.get('face_expression', 'neutral'))
-
-        # ─── الفك ───────────────────────────────────────────────────────────
-        jaw_height = 2.0
-        jaw_desc = blended['jaw'].lower()
-        if any(x in jaw_desc for x in ['wide', 'open wide']):
-            jaw_height = 5.0
-        elif any(x in jaw_desc for x in ['medium', 'medium open']):
-            jaw_height = 3.5
-        elif 'slightly open' in jaw_desc:
-            jaw_height = 2.8
-
-        jaw.set_height(jaw_height)
-        jaw.set_y(3 - jaw_height / 2)   # مركزي أكثر
-
-        # ─── الشفاه ────────────────────────────────────────────────────────
-        lips_desc = blended['lips'].lower()
-        lip_radius = 2.8
-
-        if 'closed' in lips_desc:
-            lip_radius = 2.5
-        elif any(x in lips_desc for x in ['rounded', 'forward', 'pursed', 'protruded']):
-            lip_radius = 1.8 + blended.get('lip_round', 0.0) * 0.6
-        elif 'spread' in lips_desc or 'wide' in lips_desc:
-            lip_radius = 3.2 + blended.get('lip_spread', 0.0) * 0.4
-
-        lower_lip.set_radius(lip_radius)
-        upper_lip.set_radius(lip_radius)
-
-        # ─── اللسان ────────────────────────────────────────────────────────
-        tongue_y = 4.5
-        tongue_desc = blended['tongue'].lower()
-        for key, pos in tongue_y_map.items():
-            if key in tongue_desc:
-                tongue_y = pos
-                break
-
-        tongue_tip.center = (5, tongue_y)
-
-        # ─── لون الوجه (تعبير بسيط) ───────────────────────────────────────
-        face_expr = blended['face_expression'].lower()
-        face_color = 'lightgray'
-        if any(x in face_expr for x in ['smile', 'happy']):
-            face_color = 'lightblue'
-        elif any(x in face_expr for x in ['angry', 'tense']):
-            face_color = 'lightcoral'
-        elif any(x in face_expr for x in ['surprised', 'excited']):
-            face_color = 'yellow'
-
-        jaw.set_facecolor(face_color)
+        blended = blend_movements(prev_mov, current, t=0.68)
 
         prev_mov = current.copy()
 
-        return jaw, upper_lip, lower_lip, tongue_tip
+        return apply_geometry(patches, frame_geometry(blended))
 
     # ─── إعداد الـ Animation ───────────────────────────────────────────────
     interval_ms = max(50, int(duration_per_step * 1000))   # ~8–20 إطار/ثانية تقريبًا
@@ -216,10 +252,52 @@ def visualize_speech_movements(movements: list[dict], duration_per_step=0.12):
     # لو حابب ترجع الـ animation object عشان تتحكم فيه لاحقًا
     return anim
 
-# ─── دمج مع النتيجة السابقة ────────────────────────────────
-def visualize_from_json(json_path: str):
-    import pygame  # لو مش موجود فوق
+# ─── جدولة الفريمات حسب ساعة الصوت (بدل interval ثابت) ────────────────────────
+class FrameClock:
+    """
+    يحسب رقم الفريم من الزمن المنقضي فعليًا:
+    - ساعة الصوت (pygame.mixer.music.get_pos) إذا الصوت شغال
+    - وإلا time.monotonic من لحظة start()
+    إذا الجهاز مشغول → يتخطى فريمات، وإذا أسرع → يثبت على نفس الفريم
+    """
+
+    def __init__(self, num_frames: int, duration: float, use_audio: bool = True):
+        self.num_frames = num_frames
+        self.duration = duration
+        self.frame_sec = duration / max(1, num_frames)
+        self.use_audio = use_audio
+        self.t0 = None
+
+    def start(self):
+        self.t0 = time.monotonic()
+
+    def elapsed(self) -> float:
+        if self.t0 is None:
+            self.start()
+        if self.use_audio:
+            try:
+                pos_ms = pygame.mixer.music.get_pos()
+                if pos_ms >= 0:
+                    return pos_ms / 1000.0
+            except pygame.error:
+                pass
+        return time.monotonic() - self.t0
 
+    def frame_index(self) -> int:
+        return min(self.num_frames - 1, int(self.elapsed() / self.frame_sec))
+
+    @property
+    def finished(self) -> bool:
+        return self.elapsed() >= self.duration
+
+
+# ─── دمج مع النتيجة السابقة ────────────────────────────────
+def visualize_from_json(json_path: str, tick_ms: int = 15):
+    """
+    عرض animation_sequence من ملف JSON متزامن مع الصوت:
+    - الهندسة لكل الفريمات محسوبة مسبقًا في مصفوفة → تكلفة ثابتة لكل tick
+    - كل tick يقرأ الساعة ويختار الفريم الصحيح (تخطي/تثبيت) → ما في drift على المقاطع الطويلة
+    """
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
@@ -242,48 +320,156 @@ def visualize_from_json(json_path: str):
 
     print(f"طول الصوت المحسوب: {duration:.2f} ثانية")
 
-    # 2. إعدادات الـ animation
-    interval_ms = 80
-    interval_sec = interval_ms / 1000.0
-    num_frames = max(10, int(duration / interval_sec) + 5)
-
-    print(f"عدد الفريمات المستهدف: {num_frames}")
-
-    # تكرار الحركات إذا كانت قليلة
-    if len(movements) < num_frames // 3:
-        print("عدد الحركات قليل → تكرار الـ sequence")
-        repeat_count = (num_frames // len(movements)) + 1
-        extended_movements = movements * repeat_count
-        movements = extended_movements[:num_frames]
+    # 2. الهندسة مرة واحدة + الحركات تتوزع على طول الصوت
+    geometry = precompute_geometry(movements)
+    clock = FrameClock(len(geometry), duration)
+    print(f"عدد الفريمات: {len(geometry)} (كل فريم {clock.frame_sec * 1000:.0f}ms)")
 
     # 3. إعداد الشكل والـ animation
-    fig, ax = plt.subplots(figsize=(6, 6))
-    # ... هنا تضع كود الـ patches (jaw, upper_lip, lower_lip, tongue_tip)
-    # ... وتعريف دالة update (كما في النسخة السابقة)
+    fig, patches = create_mouth_figure()
+    shown = -1
+    skipped = 0
+
+    def ticks():
+        tick = 0
+        while not clock.finished:
+            yield tick
+            tick += 1
+
+    def update(_tick):
+        nonlocal shown, skipped
+        idx = clock.frame_index()
+        if idx != shown:
+            if shown >= 0 and idx > shown + 1:
+                skipped += idx - shown - 1
+            shown = idx
+            apply_geometry(patches, geometry[idx])
+        return patches
 
     anim = FuncAnimation(
         fig,
         update,
-        frames=num_frames,
-        interval=interval_ms,
+        frames=ticks,
+        interval=tick_ms,
         blit=True,
-        repeat=False
+        repeat=False,
+        cache_frame_data=False   # ما نخزن بيانات الفريمات → ذاكرة ثابتة مهما طال المقطع
     )
 
-    # 4. تشغيل الصوت قبل أو مع بداية العرض
+    # 4. تشغيل الصوت مع بداية العرض - الساعة تبدأ معه
     try:
         pygame.mixer.music.load(output_mp3)
         pygame.mixer.music.play()
         print("بدأ تشغيل الصوت")
     except Exception as e:
+        clock.use_audio = False
         print(f"فشل تشغيل الصوت: {e}")
+    clock.start()
 
     plt.show()
 
+    if skipped:
+        logger.info(f"تم تخطي {skipped} فريم للحفاظ على التزامن")
+
     # بعد الإغلاق يمكن حذف الملف المؤقت إذا أردت
     # try: os.remove(output_mp3)
     # except: pass
-        
+
+    return anim
+
+# ─── عرض فريمات جاية من عمليات توليد أخرى عبر shared memory ────────────────
+def visualize_from_ring(
+    ring_name: str,
+    stream_id: int = None,
+    frame_sec: float = 0.12,
+    tick_ms: int = 15,
+    queue_frames: int = 256,
+    reader_lock=None
+):
+    """
+    عرض حي للفريمات من SharedFrameRing (بدون JSON وبدون قرص) أثناء وصولها:
+    - القارئ يُسجل أول شيء → الكاتب (feed_frame_ring) ينتظره قبل ما يكتب
+    - كل tick يسحب من الـ ring بقدر المساحة الفاضية في طابور محدود (queue_frames)
+      → الذاكرة ثابتة، ولو العرض أبطأ الكاتب ينتظر (backpressure) بدل ضياع فريمات
+    - فريم كل frame_sec حسب الساعة؛ لو العرض تأخر يتخطى، ولو الطابور فاضي ينتظر الكاتب
+    - stream_id: عرض نص واحد فقط من الكتّاب (None → الكل بالترتيب)
+    - reader_lock: multiprocessing.Lock مشترك بين القراء (تسجيل ذري لو فيه أكثر من renderer)
+    - إغلاق النافذة قبل النهاية → القارئ يغادر والكتّاب يوقفون (BrokenPipeError) بدل ما يعلقون
+    """
+    ring = SharedFrameRing.attach(ring_name, reader_lock=reader_lock)
+    reader_id = ring.register_reader()
+    metadata = ring.metadata
+
+    queue = deque()
+    prev_mov = None
+    next_at = None
+    received = skipped = 0
+    drained = False
+
+    def fill():
+        nonlocal prev_mov, received, drained
+        room = queue_frames - len(queue)
+        if room <= 0:
+            return
+        records = ring.read(reader_id, max_records=room, timeout=0)
+        if not len(records):
+            drained = ring.closed
+            return
+        if stream_id is not None:
+            records = records[records[:, 6] == stream_id]
+        for current in records_to_movements(records, metadata):
+            queue.append(frame_geometry(blend_movements(prev_mov or current, current)))
+            prev_mov = current
+        received += len(records)
+
+    fig, patches = create_mouth_figure()
+
+    def ticks():
+        tick = 0
+        while not (drained and not queue):
+            yield tick
+            tick += 1
+
+    def update(_tick):
+        nonlocal next_at, skipped
+        fill()
+        now = time.monotonic()
+        if next_at is None:
+            next_at = now
+
+        row, popped = None, 0
+        while queue and now >= next_at:
+            row = queue.popleft()
+            popped += 1
+            next_at += frame_sec
+        skipped += max(0, popped - 1)
+        if not queue and now >= next_at:
+            # الكاتب أبطأ من العرض → الساعة توقف لحد ما يوصل فريم جديد
+            next_at = now
+
+        if row is not None:
+            apply_geometry(patches, row)
+        return patches
+
+    anim = FuncAnimation(
+        fig,
+        update,
+        frames=ticks,
+        interval=tick_ms,
+        blit=True,
+        repeat=False,
+        cache_frame_data=False
+    )
+
+    try:
+        plt.show()
+    finally:
+        ring.unregister_reader(reader_id)
+        ring.close()
+
+    logger.info(f"تم استلام {received} فريم من الـ ring: {ring_name} (تخطي {skipped})")
+    return anim
+
 # ─── مثال التشغيل ────────────────────────────────────────────
 if __name__ == "__main__":
     import sys
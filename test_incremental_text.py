@@ -0,0 +1,77 @@
+# test_incremental_text.py
+"""
+اختبار انحدار: IncrementalTextProcessor لازم يطابق process_human_text بعد أي سلسلة تعديلات
+تشغيل: python -m pytest -q test_incremental_text.py
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("epitran")  # human_speech يخرج لو epitran غير مثبتة
+
+import human_speech as hs
+
+VOCAB = ('hello world the cat sat on mat good morning everyone is here '
+         'quick brown fox zebra xylophone').split() + ['Hi,', 'ok.', 'well!', '']
+
+
+def _strip(result: dict) -> dict:
+    result = dict(result)
+    result.pop('timestamp')
+    return result
+
+
+def _random_edit(words: list[str], rng: random.Random):
+    op = rng.random()
+    if op < 0.5 or not words:
+        words.insert(rng.randint(0, len(words)), rng.choice(VOCAB))
+    elif op < 0.8:
+        del words[rng.randrange(len(words))]
+    else:
+        words[rng.randrange(len(words))] = rng.choice(VOCAB)
+
+
+@pytest.mark.parametrize("block", [hs._FrameOffsets.BLOCK, 3])
+def test_incremental_matches_full_processing(monkeypatch, block):
+    # block صغير → يمر على split/merge داخل _FrameOffsets
+    monkeypatch.setattr(hs._FrameOffsets, "BLOCK", block)
+    rng = random.Random(block)
+    processor = hs.IncrementalTextProcessor()
+    processor.set_text("")
+    words = []
+    for step in range(300):
+        _random_edit(words, rng)
+        text = " ".join(words)
+        processor.update(text)
+        if step % 7 == 0:
+            assert _strip(processor.result()) == _strip(hs.process_human_text(text)), text
+
+
+def test_update_delta_rebuilds_animation_sequence():
+    rng = random.Random(7)
+    processor = hs.IncrementalTextProcessor()
+    words = [rng.choice(VOCAB) for _ in range(20)]
+    sequence = processor.set_text(" ".join(words))["movements"]
+    for _ in range(100):
+        _random_edit(words, rng)
+        delta = processor.update(" ".join(words))
+        lo, removed, added = delta["frames"]
+        assert len(delta["movements"]) == added
+        sequence[lo:lo + removed] = delta["movements"]
+
+    expected = hs.process_human_text(" ".join(words))["animation_sequence"]
+    rebuilt = [{**frame, "time_step": step} for step, frame in enumerate(sequence)]
+    assert rebuilt == expected
+
+
+def test_result_is_not_mutated_by_later_updates():
+    processor = hs.IncrementalTextProcessor()
+    processor.set_text("the quick brown fox")
+    held = processor.result()
+    snapshot = [dict(frame) for frame in held["animation_sequence"]]
+    visemes = list(held["viseme_sequence"])
+
+    processor.update("a quick brown fox is here")
+    assert held["animation_sequence"] == snapshot
+    assert held["viseme_sequence"] == visemes